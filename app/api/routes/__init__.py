@@ -14,6 +14,7 @@ from .product import router as product_router
 from .product_configuration import router as product_configuration_router
 from .product_accounting_account import router as product_accounting_account_router
 from .product_delivery_type import router as product_delivery_type_router
+from .product_bundle import router as product_bundle_router
 from .product_media_file import router as product_media_file_router
 from .media_file import router as media_file_router
 from .whatsapp import router as whatsapp_router
@@ -34,6 +35,7 @@ router.include_router(product_router)
 router.include_router(product_configuration_router)
 router.include_router(product_accounting_account_router)
 router.include_router(product_delivery_type_router)
+router.include_router(product_bundle_router)
 router.include_router(product_media_file_router)
 router.include_router(media_file_router)
 router.include_router(email_router)
@@ -7,6 +7,7 @@ import logging
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
 from typing import Optional, Union, Annotated
 
+from app.core.config import settings
 from app.models.ai import ChatRequest, ChatResponse
 from app.services.ai_service import ai_service
 
@@ -250,7 +251,7 @@ async def clear_history(
 ):
     """Limpia el historial de conversación de un usuario."""
     try:
-        ai_service.clear_history(user_id)
+        await ai_service.clear_history(user_id)
         return {
             "success": True,
             "message": f"Historial limpiado para usuario: {user_id}"
@@ -293,8 +294,6 @@ async def get_statistics():
 async def ai_status():
     """Verifica el estado del servicio de IA."""
     try:
-        from app.core.config import settings
-        
         stats = ai_service.get_statistics()
         
         return {
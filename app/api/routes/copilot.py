@@ -12,6 +12,7 @@ from dotenv import load_dotenv
 
 from app.utils.auth import get_current_user
 from app.models.auth import CurrentUser
+from app.core.httpx_client import get_shared_httpx
 
 # Cargar variables de entorno
 load_dotenv()
@@ -48,31 +49,31 @@ async def get_access_token() -> str:
         HTTPException: Si no se puede obtener el token
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                TOKEN_ENDPOINT,
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": COPILOT_AGENT_APP_ID,
-                    "client_secret": COPILOT_CLIENT_SECRET,
-                    "scope": "https://api.powerplatform.com/.default"
-                },
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded"
-                },
-                timeout=10.0
+        client = get_shared_httpx()
+        response = await client.post(
+            TOKEN_ENDPOINT,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": COPILOT_AGENT_APP_ID,
+                "client_secret": COPILOT_CLIENT_SECRET,
+                "scope": "https://api.powerplatform.com/.default"
+            },
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded"
+            },
+            timeout=10.0
+        )
+        
+        if response.status_code != 200:
+            logger.error(f"Error al obtener access token: {response.status_code} - {response.text}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al obtener access token: {response.status_code}"
             )
-            
-            if response.status_code != 200:
-                logger.error(f"Error al obtener access token: {response.status_code} - {response.text}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error al obtener access token: {response.status_code}"
-                )
-            
-            data = response.json()
-            return data.get("access_token", "")
-            
+        
+        data = response.json()
+        return data.get("access_token", "")
+        
     except httpx.TimeoutException:
         logger.error("Timeout al obtener access token")
         raise HTTPException(
@@ -193,76 +194,76 @@ async def get_directline_token(current_user: CurrentUser = Depends(get_current_u
         logger.info(f"   - Authorization: Bearer {access_token[:20]}...")
 
         # Crear conversación usando el SDK de Copilot Studio
-        async with httpx.AsyncClient() as client:
-            logger.info("📡 Enviando request a Copilot Studio...")
-            
-            response = await client.post(
-                COPILOT_SDK_ENDPOINT,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                },
-                params={"api-version": "2022-03-01-preview"},
-                json={},
-                timeout=10.0
-            )
+        client = get_shared_httpx()
+        logger.info("📡 Enviando request a Copilot Studio...")
+        
+        response = await client.post(
+            COPILOT_SDK_ENDPOINT,
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            },
+            params={"api-version": "2022-03-01-preview"},
+            json={},
+            timeout=10.0
+        )
 
-            logger.info(f"📡 Respuesta recibida - Status Code: {response.status_code}")
-            logger.info(f"📄 Response Headers:")
-            for key, value in response.headers.items():
-                logger.info(f"   - {key}: {value}")
+        logger.info(f"📡 Respuesta recibida - Status Code: {response.status_code}")
+        logger.info(f"📄 Response Headers:")
+        for key, value in response.headers.items():
+            logger.info(f"   - {key}: {value}")
+        
+        if response.status_code not in [200, 201]:
+            error_detail = ""
+            try:
+                error_data = response.json()
+                logger.error(f"❌ Error JSON: {error_data}")
+                error_detail = f" - Detalle: {error_data}"
+            except:
+                error_text = response.text[:500]
+                logger.error(f"❌ Error Texto: {error_text}")
+                error_detail = f" - Texto: {error_text}"
             
-            if response.status_code not in [200, 201]:
-                error_detail = ""
-                try:
-                    error_data = response.json()
-                    logger.error(f"❌ Error JSON: {error_data}")
-                    error_detail = f" - Detalle: {error_data}"
-                except:
-                    error_text = response.text[:500]
-                    logger.error(f"❌ Error Texto: {error_text}")
-                    error_detail = f" - Texto: {error_text}"
-                
-                logger.error("=" * 80)
-                logger.error(f"❌ FALLO - Error al crear conversación: {response.status_code}")
-                logger.error("=" * 80)
-                
-                # Mensaje de ayuda según el error
-                if response.status_code == 401:
-                    help_msg = "El access token no tiene los permisos correctos. Verifica Azure AD API Permissions."
-                elif response.status_code == 403:
-                    help_msg = "Acceso denegado. Verifica que el agente tenga autenticación manual habilitada."
-                elif response.status_code == 404:
-                    help_msg = "Endpoint no encontrado. Verifica COPILOT_ENVIRONMENT_ID y COPILOT_SCHEMA_NAME."
-                elif response.status_code == 405:
-                    help_msg = "Método no permitido. El agente necesita 'Autenticación Manual' habilitada y publicada."
-                else:
-                    help_msg = "Error desconocido. Revisa los logs anteriores."
-                
-                logger.error(f"💡 AYUDA: {help_msg}")
-                
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error al crear conversación con Copilot Studio: {response.status_code}. {help_msg}{error_detail}"
-                )
-
-            data = response.json()
-            logger.info("✅ Conversación creada exitosamente")
-            logger.info(f"   - Conversation ID: {data.get('conversationId', 'N/A')}")
-            logger.info(f"   - Token presente: {'✅ Sí' if data.get('token') else '❌ No'}")
-            logger.info(f"   - Stream URL presente: {'✅ Sí' if data.get('streamUrl') else '❌ No'}")
-            logger.info(f"   - Expires in: {data.get('expires_in', 'N/A')} segundos")
+            logger.error("=" * 80)
+            logger.error(f"❌ FALLO - Error al crear conversación: {response.status_code}")
+            logger.error("=" * 80)
+            
+            # Mensaje de ayuda según el error
+            if response.status_code == 401:
+                help_msg = "El access token no tiene los permisos correctos. Verifica Azure AD API Permissions."
+            elif response.status_code == 403:
+                help_msg = "Acceso denegado. Verifica que el agente tenga autenticación manual habilitada."
+            elif response.status_code == 404:
+                help_msg = "Endpoint no encontrado. Verifica COPILOT_ENVIRONMENT_ID y COPILOT_SCHEMA_NAME."
+            elif response.status_code == 405:
+                help_msg = "Método no permitido. El agente necesita 'Autenticación Manual' habilitada y publicada."
+            else:
+                help_msg = "Error desconocido. Revisa los logs anteriores."
             
-            logger.info("=" * 80)
-            logger.info("🎉 ÉXITO - Token de Copilot Studio generado correctamente")
-            logger.info("=" * 80)
+            logger.error(f"💡 AYUDA: {help_msg}")
+            
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al crear conversación con Copilot Studio: {response.status_code}. {help_msg}{error_detail}"
+            )
+
+        data = response.json()
+        logger.info("✅ Conversación creada exitosamente")
+        logger.info(f"   - Conversation ID: {data.get('conversationId', 'N/A')}")
+        logger.info(f"   - Token presente: {'✅ Sí' if data.get('token') else '❌ No'}")
+        logger.info(f"   - Stream URL presente: {'✅ Sí' if data.get('streamUrl') else '❌ No'}")
+        logger.info(f"   - Expires in: {data.get('expires_in', 'N/A')} segundos")
+        
+        logger.info("=" * 80)
+        logger.info("🎉 ÉXITO - Token de Copilot Studio generado correctamente")
+        logger.info("=" * 80)
 
-            return {
-                "token": data.get("token"),
-                "conversationId": data.get("conversationId"),
-                "streamUrl": data.get("streamUrl"),
-                "expires_in": data.get("expires_in", 3600),
-            }
+        return {
+            "token": data.get("token"),
+            "conversationId": data.get("conversationId"),
+            "streamUrl": data.get("streamUrl"),
+            "expires_in": data.get("expires_in", 3600),
+        }
 
     except httpx.TimeoutException:
         logger.error("=" * 80)
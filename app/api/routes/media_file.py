@@ -474,7 +474,7 @@ async def get_file(
         
         # Servir el archivo
         return FileResponse(
-            path=str(file_path),
+            path=file_path,
             filename=file_path.name,
             media_type="application/octet-stream"
         )
@@ -0,0 +1,142 @@
+"""
+Endpoints para edición combinada de productos.
+Proporciona funcionalidad para actualizar cuentas contables, tipos de entrega y configuración en una sola llamada.
+"""
+
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Path
+from app.utils.auth import get_current_user
+from app.models.auth import CurrentUser
+from app.models.product_bundle import (
+    ProductBundleUpdateRequest,
+    ProductBundleResponse
+)
+from app.services.product_bundle_service import update_product_bundle
+from app.core.config import settings
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Router para endpoints de edición combinada de productos
+router = APIRouter(prefix="/product/bundle", tags=["Edición Combinada de Productos"])
+
+
+@router.put(
+    "/{idProduct}",
+    response_model=ProductBundleResponse,
+    summary="Actualizar producto (edición combinada)",
+    description="""Actualiza en una sola transacción las cuentas contables, tipos de entrega y configuración de un producto.
+    
+    Pensado para el formulario de producto, que antes requería tres llamadas separadas.
+    
+    **Características:**
+    - Una sola llamada a la base de datos (spProductBundleEdit)
+    - Todo o nada: si alguna sección falla no se aplica ningún cambio
+    - Las secciones omitidas en el body no se modifican
+    
+    **Parámetros:**
+    - **idProduct** (path): ID del producto a actualizar
+    
+    **Body:**
+    - **accountingAccount** (opcional): Lista de cuentas contables (mínimo 2)
+    - **deliveryType** (opcional): Lista de tipos de entrega
+    - **configuration** (opcional): Campos de configuración del producto
+    
+    **Autenticación:**
+    - Requiere token JWT válido en el header Authorization
+    - Header: `Authorization: Bearer {token}`
+    
+    **Respuesta exitosa (200):**
+    ```json
+    {
+        "idProduct": 34
+    }
+    ```
+    
+    **Errores posibles:**
+    - **400**: Los porcentajes no suman 100 para cada efecto
+    - **401**: Token inválido o expirado
+    - **404**: Producto no encontrado o no pertenece a la compañía
+    - **500**: Error interno del servidor
+    """,
+    responses={
+        200: {
+            "description": "Producto actualizado exitosamente",
+            "content": {
+                "application/json": {
+                    "example": {"idProduct": 34}
+                }
+            }
+        },
+        400: {
+            "description": "Error de validación - Porcentajes no suman 100"
+        },
+        401: {
+            "description": "No autorizado - Token inválido o expirado"
+        },
+        404: {
+            "description": "Producto no encontrado"
+        },
+        500: {
+            "description": "Error interno del servidor"
+        }
+    }
+)
+async def update_bundle(
+    idProduct: int = Path(
+        ...,
+        description="ID del producto a actualizar",
+        gt=0,
+        example=34
+    ),
+    request: ProductBundleUpdateRequest = None,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Actualiza cuentas contables, tipos de entrega y configuración de un producto en una sola llamada.
+    """
+    try:
+        # Obtener idCompany desde settings
+        id_company = settings.idCompany
+        
+        # Convertir a diccionarios (solo las secciones recibidas)
+        accounting_accounts = None
+        if request.accountingAccount is not None:
+            accounting_accounts = [
+                item.model_dump(exclude_none=True)
+                for item in request.accountingAccount
+            ]
+        
+        delivery_types = None
+        if request.deliveryType is not None:
+            delivery_types = [
+                item.model_dump(exclude_none=True)
+                for item in request.deliveryType
+            ]
+        
+        configuration_data = None
+        if request.configuration is not None:
+            configuration_data = request.configuration.model_dump(exclude_none=True)
+        
+        # Actualizar producto
+        result = await update_product_bundle(
+            id_product=idProduct,
+            id_company=id_company,
+            accounting_accounts=accounting_accounts,
+            delivery_types=delivery_types,
+            configuration_data=configuration_data
+        )
+        
+        return result
+        
+    except ValueError as e:
+        logger.error(f"Error de validación: {str(e)}")
+        error_message = str(e)
+        status_code = 400 if "porcentajes" in error_message.lower() else 404
+        raise HTTPException(status_code=status_code, detail=error_message)
+    except Exception as e:
+        logger.error(f"Error al actualizar producto (edición combinada): {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al actualizar el producto: {str(e)}"
+        )
@@ -5,7 +5,8 @@ Proporciona webhook para recibir mensajes, notificaciones y autenticación de us
 
 from fastapi import APIRouter, HTTPException, Request, Query, Header, Depends
 from fastapi.responses import PlainTextResponse, HTMLResponse
-from typing import Optional, Dict
+from typing import Awaitable, Optional, Dict, List
+import asyncio
 import logging
 from app.models.whatsapp import (
     WhatsAppWebhookPayload,
@@ -33,6 +34,120 @@ router = APIRouter(prefix="/whatsapp", tags=["WhatsApp"])
 WEBHOOK_VERIFY_TOKEN = settings.whatsapp_verify_token
 
 
+async def _reply_to_message(message, metadata, contact_name: str):
+    """
+    Responde con IA un mensaje entrante (texto, imagen o audio), pidiendo
+    autenticación si el usuario aún no se ha autenticado.
+
+    Args:
+        message: Mensaje entrante del webhook
+        metadata: Metadata del número de WhatsApp Business que recibió el mensaje
+        contact_name: Nombre del contacto que envió el mensaje
+    """
+    try:
+        # ✅ Marcar mensaje como leído (doble check azul)
+        await whatsapp_service.mark_message_as_read(message.id)
+
+        # 🔐 VERIFICAR AUTENTICACIÓN DEL USUARIO
+        is_authenticated = await whatsapp_service.is_whatsapp_authenticated(message.from_)
+
+        if not is_authenticated:
+            logger.info("🔒 Usuario no autenticado: %s (%s)", message.from_, contact_name)
+
+            # Generar token de autenticación (incluir número del bot)
+            token = await whatsapp_service.create_auth_token(
+                phone_number=message.from_,
+                bot_phone_number=metadata.display_phone_number,
+                expires_in_seconds=300  # 5 minutos
+            )
+
+            # Construir URL de autenticación
+            auth_url = f"{settings.effective_url_base}/api/v1/whatsapp/auth/page?token={token}"
+
+            # Enviar mensaje con link de autenticación
+            auth_message = (
+                f"👋 ¡Hola {contact_name}!\n\n"
+                f"Para usar este servicio, necesitas autenticarte con tu cuenta de Microsoft.\n\n"
+                f"🔐 *Autentícate aquí:*\n{auth_url}\n\n"
+                f"⏱️ Este link es válido por *5 minutos*.\n\n"
+                f"Una vez autenticado, podrás usar el bot sin restricciones por 24 horas. ✅"
+            )
+
+            await whatsapp_service.send_text_message(
+                to=message.from_,
+                body=auth_message,
+                preview_url=True
+            )
+
+            logger.info("📤 Link de autenticación enviado a %s", message.from_)
+            return  # No procesar el mensaje hasta que se autentique
+
+        # Usuario autenticado, obtener sus datos
+        auth_data = await whatsapp_service.get_whatsapp_auth(message.from_)
+        logger.info("✅ Usuario autenticado: %s (%s)", message.from_, auth_data.get("name", contact_name))
+
+        # Extraer texto (puede ser mensaje directo o caption)
+        user_text = None
+        image_data = None
+        audio_data = None
+        media_type = None
+
+        if message.type == "text" and message.text:
+            user_text = message.text.body
+
+        elif message.type == "image" and message.image:
+            # Descargar la imagen
+            image_data = (
+                await whatsapp_service.get_media_content(
+                    message.image.id
+                )
+            )
+            user_text = (
+                message.image.caption
+                or "¿Qué ves en esta imagen?"
+            )
+            media_type = message.image.mime_type
+
+        elif message.type == "audio" and message.audio:
+            # Descargar el audio
+            audio_data = (
+                await whatsapp_service.get_media_content(
+                    message.audio.id
+                )
+            )
+            # Para audios, dejar user_text vacío - la transcripción lo reemplazará
+            user_text = None
+            media_type = message.audio.mime_type
+
+        # Generar y enviar respuesta usando IA
+        ai_result = await ai_service.process_and_reply(
+            user_message=user_text,
+            phone_number=message.from_,
+            contact_name=contact_name,
+            image_data=image_data,
+            audio_data=audio_data,
+            media_type=media_type,
+            message_id=message.id
+        )
+
+        if not ai_result["success"]:
+            logger.error(
+                f"      ❌ Error procesando con IA: {ai_result.get('error')}"
+            )
+
+    except Exception as reply_error:
+        logger.error(
+            f"      ❌ Error en respuesta automática con IA: {str(reply_error)}",
+            exc_info=True,
+        )
+
+
+async def _reply_in_order(replies: List[Awaitable[None]]):
+    """Procesa en orden las respuestas de un mismo remitente (el historial depende del orden)."""
+    for reply in replies:
+        await reply
+
+
 @router.get(
     "/webhook",
     response_class=PlainTextResponse,
@@ -164,6 +279,9 @@ async def receive_webhook(
 
         # Log del objeto principal
 
+        # Respuestas con IA agrupadas por remitente: distintos usuarios se atienden en paralelo
+        replies_by_sender: Dict[str, List[Awaitable[None]]] = {}
+
         # Procesar cada entrada
         for entry_idx, entry in enumerate(payload.entry, 1):
             pass  # Logger eliminado
@@ -213,110 +331,9 @@ async def receive_webhook(
                         # 🤖 RESPUESTA AUTOMÁTICA CON IA MULTIMODAL
                         # Soporta: texto, imágenes y audios
                         if message.type in ["text", "image", "audio"]:
-                            try:
-                                # ✅ Marcar mensaje como leído (doble check azul)
-                                await whatsapp_service.mark_message_as_read(message.id)
-
-                                # 🔐 VERIFICAR AUTENTICACIÓN DEL USUARIO
-                                is_authenticated = await whatsapp_service.is_whatsapp_authenticated(message.from_)
-                                
-                                if not is_authenticated:
-                                    logger.info(f"🔒 Usuario no autenticado: {message.from_} ({contact_name})")
-                                    
-                                    # Generar token de autenticación (incluir número del bot)
-                                    token = await whatsapp_service.create_auth_token(
-                                        phone_number=message.from_,
-                                        bot_phone_number=metadata.display_phone_number,
-                                        expires_in_seconds=300  # 5 minutos
-                                    )
-                                    
-                                    # Construir URL de autenticación
-                                    from app.core.config import settings
-                                    auth_url = f"{settings.effective_url_base}/api/v1/whatsapp/auth/page?token={token}"
-                                    
-                                    # Enviar mensaje con link de autenticación
-                                    auth_message = (
-                                        f"👋 ¡Hola {contact_name}!\n\n"
-                                        f"Para usar este servicio, necesitas autenticarte con tu cuenta de Microsoft.\n\n"
-                                        f"🔐 *Autentícate aquí:*\n{auth_url}\n\n"
-                                        f"⏱️ Este link es válido por *5 minutos*.\n\n"
-                                        f"Una vez autenticado, podrás usar el bot sin restricciones por 24 horas. ✅"
-                                    )
-                                    
-                                    await whatsapp_service.send_text_message(
-                                        to=message.from_,
-                                        body=auth_message,
-                                        preview_url=True
-                                    )
-                                    
-                                    logger.info(f"📤 Link de autenticación enviado a {message.from_}")
-                                    continue  # No procesar el mensaje hasta que se autentique
-                                
-                                # Usuario autenticado, obtener sus datos
-                                auth_data = await whatsapp_service.get_whatsapp_auth(message.from_)
-                                logger.info(f"✅ Usuario autenticado: {message.from_} ({auth_data.get('name', contact_name)})")
-
-                                # Extraer texto (puede ser mensaje directo o caption)
-                                user_text = None
-                                image_data = None
-                                audio_data = None
-                                media_type = None
-
-                                if message.type == "text" and message.text:
-                                    user_text = message.text.body
-
-                                elif message.type == "image" and message.image:
-                                    # Descargar la imagen
-                                    image_data = (
-                                        await whatsapp_service.get_media_content(
-                                            message.image.id
-                                        )
-                                    )
-                                    user_text = (
-                                        message.image.caption
-                                        or "¿Qué ves en esta imagen?"
-                                    )
-                                    media_type = message.image.mime_type
-
-                                elif message.type == "audio" and message.audio:
-                                    # Descargar el audio
-                                    audio_data = (
-                                        await whatsapp_service.get_media_content(
-                                            message.audio.id
-                                        )
-                                    )
-                                    # Para audios, dejar user_text vacío - la transcripción lo reemplazará
-                                    user_text = None
-                                    media_type = message.audio.mime_type
-
-                                # Generar y enviar respuesta usando IA
-                                ai_result = await ai_service.process_and_reply(
-                                    user_message=user_text,
-                                    phone_number=message.from_,
-                                    contact_name=contact_name,
-                                    image_data=image_data,
-                                    audio_data=audio_data,
-                                    media_type=media_type
-                                )
-
-                                if ai_result["success"]:
-                                    pass  # Logger eliminado
-                                    if ai_result.get("processed_media"):
-                                        media_info = ai_result["processed_media"]
-                                        if media_info.get("has_image"):
-                                            pass  # Logger eliminado
-                                        if media_info.get("has_audio"):
-                                            pass  # Logger eliminado
-                                else:
-                                    logger.error(
-                                        f"      ❌ Error procesando con IA: {ai_result.get('error')}"
-                                    )
-
-                            except Exception as reply_error:
-                                logger.error(
-                                    f"      ❌ Error en respuesta automática con IA: {str(reply_error)}",
-                                    exc_info=True,
-                                )
+                            replies_by_sender.setdefault(message.from_, []).append(
+                                _reply_to_message(message, metadata, contact_name)
+                            )
 
                 # Procesar cambios de estado
                 if change.value.statuses:
@@ -325,6 +342,10 @@ async def receive_webhook(
                     for status_idx, status in enumerate(change.value.statuses, 1):
                         pass  # Logger eliminado
 
+        # Responder todos los mensajes del lote a la vez (Azure OpenAI comparte el pool de conexiones)
+        if replies_by_sender:
+            await asyncio.gather(*(_reply_in_order(replies) for replies in replies_by_sender.values()))
+
         # Log del payload completo en formato JSON
 
         # Retornar confirmación de recepción
@@ -756,7 +777,7 @@ async def clear_ai_history(
     phone_number: str, current_user: CurrentUser = Depends(get_current_user)
 ):
     """Limpia el historial de conversación de un usuario."""
-    ai_service.clear_history(phone_number)
+    await ai_service.clear_history(phone_number)
     return {"success": True, "message": f"Historial limpiado para {phone_number}"}
 
 
@@ -7,7 +7,6 @@ from fastapi import APIRouter, HTTPException, Query, Path, Depends, UploadFile,
 from fastapi.responses import StreamingResponse
 from typing import Optional
 import logging
-import io
 
 from app.services.sharepoint_service import sharepoint_service
 from app.models.sharepoint import (
@@ -415,14 +414,25 @@ async def download_file(
 ):
     """Descarga un archivo de SharePoint."""
     try:
-        file_content = await sharepoint_service.download_file(
+        stream = sharepoint_service.download_file_stream(
             site_id=site_id,
             drive_id=drive_id,
             item_id=item_id
         )
         
+        # Leer el primer fragmento antes de responder para que los errores de Graph lleguen como 500
+        try:
+            first_chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            first_chunk = b""
+        
+        async def content():
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        
         return StreamingResponse(
-            io.BytesIO(file_content),
+            content(),
             media_type="application/octet-stream",
             headers={"Content-Disposition": f"attachment; filename=document"}
         )
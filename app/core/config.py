@@ -19,9 +19,15 @@ class Settings(BaseSettings):
     azure_openai_api_key: str
     azure_openai_deployment_name: str
     azure_openai_chat_deployment_name: str = "gpt-5-pro"  # Deployment para chat (WhatsApp, etc.)
+    azure_openai_fast_deployment_name: Optional[str] = None  # Deployment rápido para mensajes cortos (ej: gpt-4o-mini; None = siempre chat)
     azure_openai_audio_deployment_name: str = "gpt-4o-transcribe"  # Deployment para transcripción de audio
     azure_openai_api_version: str = "2024-12-01-preview"
     azure_openai_audio_api_version: str = "2025-03-01-preview"  # API version para audio transcription
+    azure_openai_max_completion_tokens: int = 2000  # Presupuesto de reasoning + respuesta visible por llamada de chat
+    azure_openai_max_retries: int = 2  # Reintentos del SDK ante 429/5xx/timeouts (dentro del límite total por respuesta)
+    azure_openai_reasoning_effort: Optional[str] = None  # "minimal" | "low" | "medium" | "high" (None = default del modelo)
+    azure_openai_stream_responses: bool = True  # Respuestas de WhatsApp en streaming (False = esperar la respuesta completa)
+    ai_max_active_conversations: int = 10000  # Conversaciones en memoria sin Redis (se descarta la menos reciente)
     
     # Configuración de Microsoft Azure AD (opcional para autenticación)
     azure_client_id: Optional[str] = None
@@ -73,6 +79,8 @@ class Settings(BaseSettings):
     whatsapp_phone_number_id: Optional[str] = None
     whatsapp_verify_token: str = "mi_token_secreto_whatsapp_2024"
     whatsapp_api_version: str = "v24.0"
+    whatsapp_max_messages_per_second: int = 80  # Límite de envíos por segundo de la Graph API (ventana deslizante)
+    whatsapp_bulk_concurrency: int = 50  # Envíos simultáneos en send_bulk (límite de la API: 80+ mensajes/s)
     
     # Configuración de Redis
     redis_host: str = "localhost"
@@ -0,0 +1,46 @@
+"""
+Cliente httpx compartido por todo el proceso.
+Mantiene un único pool de conexiones (con keep-alive y HTTP/2) para los servicios
+que requieren httpx, como el SDK de Azure OpenAI.
+"""
+
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Instancia compartida (se crea en el primer uso o al iniciar la aplicación)
+_shared: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_httpx() -> httpx.AsyncClient:
+    """
+    Obtiene el cliente httpx compartido, creándolo si no existe o fue cerrado.
+    La creación es síncrona, por lo que no hay carreras entre corrutinas.
+    
+    Returns:
+        httpx.AsyncClient: Cliente compartido
+    """
+    global _shared
+    if _shared is None or _shared.is_closed:
+        # Con transport explícito los límites del pool se configuran en el transport
+        _shared = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=1,
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30)
+            )
+        )
+    return _shared
+
+
+async def close_shared_httpx():
+    """Cierra el cliente httpx compartido (llamar al apagar la aplicación)."""
+    global _shared
+    if _shared is not None and not _shared.is_closed:
+        await _shared.aclose()
+        logger.info("Cliente httpx compartido cerrado")
+    _shared = None
@@ -12,6 +12,15 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 
+# Borra la clave solo si conserva el valor indicado (liberación segura de locks)
+_DELETE_IF_EQUALS_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
 class RedisClient:
     """
     Cliente genérico de Redis para operaciones de cache y persistencia temporal.
@@ -257,6 +266,121 @@ class RedisClient:
     
     # ============== MÉTODOS AVANZADOS ==============
     
+    async def set_if_not_exists(
+        self,
+        key: str,
+        value: Any,
+        expires_in_seconds: int
+    ) -> bool:
+        """
+        Guarda un valor solo si la clave no existe (SET NX), útil como lock distribuido.
+        
+        Args:
+            key: Clave para identificar el valor
+            value: Valor a guardar (será serializado a JSON si no es string)
+            expires_in_seconds: Tiempo de expiración en segundos
+            
+        Returns:
+            True si se guardó, False si la clave ya existía
+            
+        Example:
+            if await redis_client.set_if_not_exists("job:lock", "1", expires_in_seconds=30):
+                ...  # Solo un proceso entra aquí
+        """
+        self._check_connection()
+        
+        value_str = json.dumps(value) if not isinstance(value, str) else value
+        
+        result = await self.redis_client.set(key, value_str, ex=expires_in_seconds, nx=True)
+        return bool(result)
+    
+    async def delete_if_equals(self, key: str, value: str) -> bool:
+        """
+        Elimina una clave solo si su valor es el indicado (compare-and-delete atómico con Lua).
+        Sirve para liberar un lock tomado con set_if_not_exists sin borrar el de otro proceso.
+        
+        Args:
+            key: Clave a eliminar
+            value: Valor que debe tener la clave
+            
+        Returns:
+            True si se eliminó, False si no existía o tenía otro valor
+            
+        Example:
+            await redis_client.delete_if_equals("job:lock", lock_token)
+        """
+        self._check_connection()
+        
+        result = await self.redis_client.eval(_DELETE_IF_EQUALS_SCRIPT, 1, key, value)
+        return bool(result)
+    
+    async def list_append(
+        self,
+        key: str,
+        values: list[str],
+        max_length: int,
+        expires_in_seconds: int,
+        related_keys: tuple[str, ...] = ()
+    ) -> None:
+        """
+        Agrega valores al final de una lista, conserva solo los últimos max_length
+        y renueva su expiración (RPUSH + LTRIM + EXPIRE en una sola transacción).
+        
+        Args:
+            key: Clave de la lista
+            values: Valores ya serializados a agregar
+            max_length: Máximo de elementos a conservar (los más recientes)
+            expires_in_seconds: Tiempo de expiración en segundos
+            related_keys: Otras claves cuya expiración se renueva junto con la lista (opcional)
+            
+        Example:
+            await redis_client.list_append("chat:123", [mensaje_json], max_length=30, expires_in_seconds=3600)
+        """
+        self._check_connection()
+        
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *values)
+            pipe.ltrim(key, -max_length, -1)
+            pipe.expire(key, expires_in_seconds)
+            for related_key in related_keys:
+                pipe.expire(related_key, expires_in_seconds)
+            await pipe.execute()
+    
+    async def list_trim(self, key: str, start: int, end: int = -1) -> None:
+        """
+        Conserva solo un rango de elementos de una lista (LTRIM).
+        
+        Args:
+            key: Clave de la lista
+            start: Índice inicial a conservar
+            end: Índice final a conservar (inclusive, -1 para el último)
+            
+        Example:
+            await redis_client.list_trim("chat:123", 10)  # descarta los 10 más antiguos
+        """
+        self._check_connection()
+        
+        await self.redis_client.ltrim(key, start, end)
+    
+    async def list_range(self, key: str, start: int = 0, end: int = -1) -> list:
+        """
+        Obtiene un rango de elementos de una lista (LRANGE), sin deserializar.
+        
+        Args:
+            key: Clave de la lista
+            start: Índice inicial
+            end: Índice final (inclusive, -1 para el último)
+            
+        Returns:
+            Lista de elementos (vacía si la clave no existe)
+            
+        Example:
+            messages = await redis_client.list_range("chat:123")
+        """
+        self._check_connection()
+        
+        return await self.redis_client.lrange(key, start, end)
+    
     async def get_many(self, *keys: str) -> list[Optional[Any]]:
         """
         Obtiene múltiples valores en una sola operación.
@@ -5,8 +5,10 @@ Maneja conexiones a SQL Server y ejecución de stored procedures con JSON usando
 
 import json
 import logging
-from typing import Dict, Any, Optional
+from decimal import Decimal
+from typing import Dict, Any, Optional, Union
 import aioodbc
+import orjson
 import pyodbc  # Para tipos y excepciones
 from app.core.config import settings
 
@@ -14,6 +16,13 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 
+def _json_default(value: Any) -> Any:
+    """Serializa tipos no soportados por orjson (ej: Decimal de los modelos Pydantic)."""
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Tipo no serializable a JSON: {type(value).__name__}")
+
+
 class AsyncDatabaseManager:
     """Administrador asíncrono de conexiones y operaciones de base de datos."""
     
@@ -54,14 +63,19 @@ class AsyncDatabaseManager:
             logger.error(f"Error en test de conexión asíncrona: {str(e)}")
             return False
     
-    async def execute_stored_procedure(self, procedure_name: str, json_param: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute_stored_procedure(
+        self,
+        procedure_name: str,
+        json_param: Union[Dict[str, Any], bytes, str]
+    ) -> Dict[str, Any]:
         """
         Ejecuta de forma asíncrona un stored procedure que recibe un JSON como parámetro único
         y devuelve un JSON en una columna llamada 'json'.
         
         Args:
             procedure_name (str): Nombre del stored procedure a ejecutar
-            json_param (Dict[str, Any]): Parámetros en formato diccionario que se convertirán a JSON
+            json_param (Union[Dict[str, Any], bytes, str]): Parámetros en formato diccionario que se
+                convertirán a JSON, o JSON ya serializado (se envía tal cual, debe incluir idCompany)
             
         Returns:
             Dict[str, Any]: Respuesta del stored procedure parseada desde JSON
@@ -70,11 +84,17 @@ class AsyncDatabaseManager:
             Exception: Si hay error en la ejecución del stored procedure
         """
         try:
-            # Agregar idCompany al parámetro JSON desde settings
-            json_param["idCompany"] = settings.idCompany
-            
-            # Convertir el diccionario a JSON string
-            json_string = json.dumps(json_param, ensure_ascii=False)
+            if isinstance(json_param, dict):
+                # Agregar idCompany al parámetro JSON desde settings
+                json_param["idCompany"] = settings.idCompany
+                
+                # Convertir el diccionario a JSON string (una sola serialización, con orjson)
+                json_string = orjson.dumps(json_param, default=_json_default).decode()
+            elif isinstance(json_param, bytes):
+                # JSON ya serializado por el llamador
+                json_string = json_param.decode()
+            else:
+                json_string = json_param
             
             async with await self.get_connection() as conn:
                 async with conn.cursor() as cursor:
@@ -108,7 +128,7 @@ class AsyncDatabaseManager:
                             return {"success": True}
                         
                         # Parsear el JSON de respuesta
-                        result = json.loads(json_result)
+                        result = orjson.loads(json_result)
                         logger.info(f"Resultado parseado exitosamente")
                         return result
                         
@@ -181,13 +201,17 @@ async def test_db_connection() -> bool:
     return await async_db_manager.test_connection()
 
 
-async def execute_sp(procedure_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+async def execute_sp(
+    procedure_name: str,
+    parameters: Union[Dict[str, Any], bytes, str]
+) -> Dict[str, Any]:
     """
     Función de conveniencia para ejecutar stored procedures de forma asíncrona.
     
     Args:
         procedure_name (str): Nombre del stored procedure
-        parameters (Dict[str, Any]): Parámetros a enviar al stored procedure
+        parameters (Union[Dict[str, Any], bytes, str]): Parámetros a enviar al stored procedure
+            (diccionario o JSON ya serializado)
         
     Returns:
         Dict[str, Any]: Respuesta del stored procedure
@@ -89,6 +89,14 @@ async def lifespan(app: FastAPI):
     # Inicializar email queue
     await email_queue.start()
     
+    # Crear el cliente httpx compartido antes de atender solicitudes
+    from app.core.httpx_client import get_shared_httpx, close_shared_httpx
+    get_shared_httpx()
+    
+    # Iniciar limpieza de conversaciones inactivas del servicio de IA
+    from app.services.ai_service import ai_service
+    await ai_service.start()
+    
     # Inicializar Redis (REQUERIDO)
     try:
         await redis_client.initialize()
@@ -102,6 +110,16 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     await email_queue.stop()
+    await ai_service.stop()
+    from app.services.openai_client import close_openai_client
+    await close_openai_client()
+    await close_shared_httpx()
+    
+    # Cerrar conexiones HTTP compartidas de SharePoint
+    from app.services.sharepoint_auth import sharepoint_auth_service
+    from app.services.sharepoint_service import sharepoint_service
+    await sharepoint_service.close()
+    await sharepoint_auth_service.close()
     
     # Cerrar Redis
     try:
@@ -0,0 +1,91 @@
+"""
+Modelos Pydantic para edición combinada de productos.
+Define las estructuras de datos para actualizar cuentas contables, tipos de entrega y configuración juntos.
+"""
+
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.models.product_accounting_account import AccountingAccountItem
+from app.models.product_delivery_type import DeliveryTypeItem
+from app.models.product_configuration import ProductConfigurationUpdateRequest
+
+
+class ProductBundleUpdateRequest(BaseModel):
+    """
+    Modelo para request de edición combinada de producto.
+    Las secciones omitidas no se modifican.
+    """
+    
+    accountingAccount: Optional[List[AccountingAccountItem]] = Field(
+        default=None,
+        description="Lista de cuentas contables con sus configuraciones (mínimo 2 cuentas requeridas)",
+        min_length=2
+    )
+    
+    deliveryType: Optional[List[DeliveryTypeItem]] = Field(
+        default=None,
+        description="Lista de tipos de entrega con sus configuraciones",
+        min_length=1
+    )
+    
+    configuration: Optional[ProductConfigurationUpdateRequest] = Field(
+        default=None,
+        description="Configuración del producto"
+    )
+
+    class Config:
+        """Configuración del modelo Pydantic."""
+        json_schema_extra = {
+            "example": {
+                "accountingAccount": [
+                    {
+                        "idAccountingAccount": 1,
+                        "effect": 1,
+                        "percent": 100.0000,
+                        "idProductAccountingAccount": 67
+                    },
+                    {
+                        "idAccountingAccount": 2,
+                        "effect": -1,
+                        "percent": 100.0000,
+                        "idProductAccountingAccount": None
+                    }
+                ],
+                "deliveryType": [
+                    {
+                        "idDeliveryType": 1,
+                        "active": True,
+                        "price": 13.1313,
+                        "idProductDeliveryType": 67
+                    }
+                ],
+                "configuration": {
+                    "isMainCategory": False,
+                    "isCategory": True,
+                    "isProduct": False,
+                    "isIngredient": False,
+                    "isAdditional": False,
+                    "isCombo": False,
+                    "isUniqueSelection": False
+                }
+            }
+        }
+
+
+class ProductBundleResponse(BaseModel):
+    """
+    Modelo para response de edición combinada de producto.
+    """
+    
+    idProduct: int = Field(
+        description="ID del producto actualizado",
+        examples=[1, 2, 100]
+    )
+
+    class Config:
+        """Configuración del modelo Pydantic."""
+        json_schema_extra = {
+            "example": {
+                "idProduct": 34
+            }
+        }
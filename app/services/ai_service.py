@@ -4,32 +4,46 @@ Proporciona respuestas inteligentes automáticas a mensajes.
 Soporta procesamiento multimodal: texto, imágenes y audios.
 """
 
-import base64
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, List
-from openai import AsyncAzureOpenAI
+import re
+import time
+from collections import OrderedDict
+from contextlib import aclosing, asynccontextmanager
+from functools import cached_property
+from io import BytesIO
+from typing import Optional, Dict, Final, List, Tuple, Any, AsyncIterator, TypedDict
+import openai
+import pybase64
+import tiktoken
+from PIL import Image
 
 from app.core.config import settings
-from app.core.http_request import HTTPClient
+from app.core.httpx_client import get_shared_httpx
+from app.services.conversation_archive import conversation_archive
+from app.services.conversation_store import ConversationStore
+from app.services.openai_client import get_openai_client
+from app.services.whatsapp_service import whatsapp_service
 
 logger = logging.getLogger(__name__)
 
+# Tiempo máximo por llamada a chat completions y límite total (incluye el reintento del SDK)
+CHAT_COMPLETION_TIMEOUT_SECONDS = 45.0
+CHAT_COMPLETION_DEADLINE_SECONDS = 50.0
+# Tiempo máximo sin recibir fragmentos una vez iniciado el streaming (generación atascada).
+# El primer fragmento puede tardar más (reasoning) y solo está limitado por el límite total
+STREAM_IDLE_TIMEOUT_SECONDS = 15.0
+# Presupuesto del reintento cuando el modelo agota max_completion_tokens en reasoning sin responder
+LENGTH_RETRY_MAX_COMPLETION_TOKENS = 8000
 
-class AIService:
-    """
-    Servicio para generar respuestas automáticas de IA.
-    
-    Utiliza Azure OpenAI para generar respuestas contextuales e inteligentes
-    basadas en el historial de conversación y el contexto del negocio.
-    """
-    
-    def __init__(self):
-        """Inicializa el servicio de IA."""
-        self._client: Optional[AsyncAzureOpenAI] = None
-        self._conversation_history: Dict[str, List[Dict[str, str]]] = {}
-        
-        # Configuración del sistema
-        self.system_prompt = """Eres un asistente virtual de Ezekl Budget, una aplicación de gestión financiera y presupuestos.
+# Caracteres a partir de los cuales se envía por WhatsApp el primer bloque de una respuesta en streaming
+STREAM_FIRST_MESSAGE_CHARS = 300
+
+# Prompt de sistema: debe ser idéntico y primero en todas las solicitudes para que Azure
+# reutilice el prefijo en caché (prompt caching). No interpolar datos del usuario aquí;
+# el contexto por usuario va en mensajes posteriores (ej: el resumen de la conversación)
+SYSTEM_PROMPT: Final[str] = """Eres un asistente virtual de Ezekl Budget, una aplicación de gestión financiera y presupuestos.
 
 Tu función es:
 - Responder consultas sobre la aplicación y sus funcionalidades
@@ -48,8 +62,217 @@ Información importante:
 - Email de soporte: soporte@ezeklbudget.com
 - Horario de atención: Lunes a Viernes 9:00 AM - 6:00 PM"""
 
-        self.max_history_messages = 10  # Máximo de mensajes a recordar por conversación
+# Respuesta cuando el modelo devuelve contenido vacío
+DEFAULT_RESPONSE = "¡Hola! 👋 Gracias por contactarnos. ¿En qué puedo ayudarte con Ezekl Budget?"
+# Respuesta de fallback ante errores de Azure OpenAI
+FALLBACK_RESPONSE = (
+    "Disculpa, estoy teniendo problemas técnicos 😅. "
+    "Por favor contacta a nuestro equipo de soporte en soporte@ezeklbudget.com"
+)
+
+# Tamaño máximo de media que se envía a Azure OpenAI (imágenes: límite de WhatsApp)
+MAX_IMAGE_BYTES = 5_000_000
+MAX_AUDIO_BYTES = 10_000_000
+# Respuesta cuando el media supera esos límites (no se llama a Azure)
+MEDIA_TOO_LARGE_RESPONSE = (
+    "El archivo que enviaste es demasiado grande para procesarlo 😅. "
+    "¿Podrías enviarme uno más pequeño?"
+)
+
+# Formato de imagen/audio por tipo MIME (sin parámetros como "; codecs=opus")
+_IMAGE_FORMATS = {"image/jpeg": "jpeg", "image/jpg": "jpeg", "image/png": "png", "image/webp": "webp"}
+_AUDIO_FORMATS = {
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/mp4": "m4a",
+    "audio/m4a": "m4a",
+    "audio/x-m4a": "m4a"
+}
+
+# Data URLs de imágenes recientes (reintentos y reenvíos de WhatsApp repiten el mismo archivo)
+DATA_URL_CACHE_MAX_SIZE = 256
+
+# Imágenes más pesadas que esto se reducen antes de enviarlas; con detail="low"
+# Azure solo usa ~512x512, así que el original completo es carga desperdiciada
+IMAGE_RESIZE_MIN_BYTES = 200_000
+IMAGE_MAX_DIMENSION = 512
+IMAGE_JPEG_QUALITY = 80
+# A partir de este tamaño el base64 se calcula en un hilo para no bloquear el event loop
+# (por debajo es más barato codificar en línea que cambiar de hilo)
+ENCODE_IN_THREAD_MIN_BYTES = 64 * 1024
+
+# Resumen continuo: al llegar a SUMMARY_TRIGGER_MESSAGES mensajes, los SUMMARY_BATCH_MESSAGES
+# más antiguos se resumen en segundo plano y se reemplazan por el resumen
+SUMMARY_TRIGGER_MESSAGES = 20
+SUMMARY_BATCH_MESSAGES = 10
+SUMMARY_MAX_COMPLETION_TOKENS = 2000  # incluye los reasoning tokens de GPT-5
+# Largo máximo del resumen guardado (si el modelo se excede se corta en el último fin de oración)
+SUMMARY_MAX_CHARS = 1000
+SUMMARY_PROMPT = (
+    "Resume la siguiente conversación entre un usuario y el asistente de Ezekl Budget "
+    "en máximo 200 tokens, en español. Conserva el nombre del usuario, sus preferencias, "
+    "datos concretos que haya dado y temas pendientes. Responde solo con el resumen."
+)
+
+# Saludos y confirmaciones que no necesitan el historial (se envían solo con el prompt de sistema)
+_GREETING_RE = re.compile(
+    r"^(hola|hi|hey|buenas|buenos d[ií]as|buenas (tardes|noches)|gracias|muchas gracias|ok|okay|vale|listo|perfecto|👍|👋|🙏)\W*$",
+    re.IGNORECASE
+)
+
+# Caché de respuestas a mensajes sin contexto (saludos, preguntas frecuentes): mensaje normalizado -> respuesta
+REPLY_CACHE_MAX_SIZE = 2048
+REPLY_CACHE_TTL_SECONDS = 3600
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Tokens fijos que agrega el formato de chat por cada mensaje
+TOKENS_PER_MESSAGE = 4
+
+# Router al deployment rápido: solo mensajes de texto más cortos que esto
+FAST_MODEL_MAX_CHARS = 200
+FAST_MODEL_TIMEOUT_SECONDS = 10.0
+FAST_MODEL_MAX_COMPLETION_TOKENS = 500
+# Respuestas del modelo rápido que indican que la pregunta necesita a GPT-5
+_LOW_CONFIDENCE_RE = re.compile(
+    r"no estoy segur[oa]|no tengo (suficiente )?informaci[oó]n|no (lo )?s[eé]\b|no puedo (ayudarte|responder)",
+    re.IGNORECASE
+)
+
+# Codificador de tokens (se carga en el primer uso; None si no está disponible)
+_encoding = None
+_encoding_loaded = False
+
+
+def _count_tokens(text: str) -> int:
+    """
+    Estima los tokens de un texto con tiktoken.
+    Si el codificador no se puede cargar (p. ej. sin acceso a red), usa ~4 caracteres por token.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            _encoding = tiktoken.encoding_for_model("gpt-4o")
+        except Exception as e:
+            logger.warning("⚠️ No se pudo cargar tiktoken, se estimarán tokens por caracteres: %s", e)
+    
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+async def _no_result() -> None:
+    """Resultado vacío para los pasos opcionales de un asyncio.gather."""
+    return None
+
+
+def _mime_type(media_type: Optional[str]) -> str:
+    """Tipo MIME en minúsculas sin parámetros ('audio/ogg; codecs=opus' -> 'audio/ogg')."""
+    return media_type.split(";", 1)[0].strip().lower() if media_type else ""
+
+
+def _resize_image(image_bytes: bytes) -> bytes:
+    """Reduce la imagen a IMAGE_MAX_DIMENSION en su lado mayor y la recodifica como JPEG."""
+    with Image.open(BytesIO(image_bytes)) as image:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+def _sentence_split_point(text: str) -> int:
+    """Posición justo después del último fin de oración o salto de línea (0 si no hay)."""
+    return max(text.rfind(". "), text.rfind("! "), text.rfind("? "), text.rfind("\n")) + 1
+
+
+class ProcessedMedia(TypedDict):
+    """Media incluido en el mensaje procesado."""
+    has_image: bool
+    has_audio: bool
+
+
+class ReplyResult(TypedDict, total=False):
+    """Resultado de process_and_reply."""
+    success: bool
+    processed_media: ProcessedMedia
+    ai_response: str
+    whatsapp_message_id: Optional[str]
+    whatsapp_message_ids: List[Optional[str]]
+    error: str
+
+
+class AIService:
+    """
+    Servicio para generar respuestas automáticas de IA.
+    
+    Utiliza Azure OpenAI para generar respuestas contextuales e inteligentes
+    basadas en el historial de conversación y el contexto del negocio.
+    """
+    
+    def __init__(self):
+        """
+        Inicializa el servicio de IA.
+        
+        La instancia global se crea al importar el módulo: el cliente de Azure OpenAI y tiktoken
+        se cargan en el primer uso (ver client y _max_history_tokens), no aquí.
+        """
+        # Prompt de sistema compartido por todas las conversaciones
+        self.system_prompt = SYSTEM_PROMPT
+
+        self.max_history_messages = 30  # Máximo de mensajes a recordar por conversación
+        self.max_context_tokens = 8000  # Presupuesto de tokens de entrada (sistema + historial)
         self.max_response_tokens = 500  # Tokens máximos para respuesta (GPT-5 necesita más margen)
+        
+        # Mensaje de sistema y deployment son fijos: se construyen una sola vez
+        self._system_msg = {"role": "system", "content": self.system_prompt}
+        self._deployment_name = settings.azure_openai_chat_deployment_name
+        self._max_completion_tokens = settings.azure_openai_max_completion_tokens
+        # Sin configurar no se envía (no todos los deployments aceptan reasoning_effort)
+        self._reasoning_effort = settings.azure_openai_reasoning_effort or openai.omit
+        self._fast_deployment_name = settings.azure_openai_fast_deployment_name
+        
+        # Historial por número (Redis, o memoria del proceso si Redis no está disponible)
+        self._store = ConversationStore(
+            self.max_history_messages,
+            max_conversations=settings.ai_max_active_conversations
+        )
+        
+        # Caché LRU de data URLs: hash BLAKE2 de la imagen + formato -> data URL
+        self._data_url_cache: "OrderedDict[Tuple[bytes, str], str]" = OrderedDict()
+        
+        # Caché LRU de respuestas sin contexto: mensaje normalizado -> (expiración, respuesta)
+        self._reply_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._reply_cache_hits = 0
+        
+        # Solicitudes rechazadas por media demasiado grande
+        self._rejected_media = 0
+        
+        # Respuestas del deployment rápido y escalamientos a GPT-5
+        self._fast_replies = 0
+        self._fast_escalations = 0
+        
+        # Locks por número con la cantidad de respuestas que los usan (se eliminan al quedar sin uso)
+        self._locks: Dict[str, Tuple[asyncio.Lock, List[int]]] = {}
+        
+        # Resúmenes en curso por número (evita resumir dos veces la misma conversación)
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
+    
+    @property
+    def client(self) -> openai.AsyncAzureOpenAI:
+        """Cliente de Azure OpenAI compartido por todo el proceso (se crea en el primer uso)."""
+        return get_openai_client()
+    
+    @cached_property
+    def _max_history_tokens(self) -> int:
+        """Presupuesto de tokens para el historial (contar el prompt de sistema carga tiktoken)."""
+        system_tokens = _count_tokens(self.system_prompt) + TOKENS_PER_MESSAGE
+        return self.max_context_tokens - self.max_response_tokens - system_tokens
     
     def _encode_image_to_base64(self, image_bytes: bytes) -> str:
         """
@@ -61,12 +284,84 @@ Información importante:
         Returns:
             Imagen codificada en base64
         """
-        return base64.b64encode(image_bytes).decode('utf-8')
+        # Devuelve str directamente: evita la copia intermedia de bytes + decode
+        return pybase64.b64encode_as_string(image_bytes)
+    
+    async def _image_data_url(self, image_bytes: bytes, image_format: str) -> str:
+        """
+        Construye el data URL de una imagen, reutilizando el de una imagen idéntica reciente.
+        Las imágenes pesadas se reducen y recodifican como JPEG fuera del event loop.
+        
+        Args:
+            image_bytes: Contenido de la imagen en bytes
+            image_format: Formato de la imagen ('jpeg', 'png' o 'webp')
+            
+        Returns:
+            data URL con la imagen codificada en base64
+        """
+        key = (hashlib.blake2b(image_bytes, digest_size=16).digest(), image_format)
+        data_url = self._data_url_cache.get(key)
+        if data_url is not None:
+            self._data_url_cache.move_to_end(key)
+            return data_url
+        
+        if len(image_bytes) > IMAGE_RESIZE_MIN_BYTES:
+            try:
+                image_bytes = await asyncio.to_thread(_resize_image, image_bytes)
+                image_format = "jpeg"
+            except Exception as e:
+                logger.warning("⚠️ No se pudo reducir la imagen, se envía la original: %s", e)
+        
+        if len(image_bytes) > ENCODE_IN_THREAD_MIN_BYTES:
+            image_base64 = await asyncio.to_thread(self._encode_image_to_base64, image_bytes)
+        else:
+            image_base64 = self._encode_image_to_base64(image_bytes)
+        
+        data_url = f"data:image/{image_format};base64,{image_base64}"
+        self._data_url_cache[key] = data_url
+        if len(self._data_url_cache) > DATA_URL_CACHE_MAX_SIZE:
+            self._data_url_cache.popitem(last=False)
+        return data_url
+    
+    @asynccontextmanager
+    async def _conversation_lock(self, phone_number: str):
+        """Serializa las respuestas de una misma conversación; el lock se descarta cuando nadie lo usa."""
+        entry = self._locks.get(phone_number)
+        if entry is None:
+            entry = self._locks[phone_number] = (asyncio.Lock(), [0])
+        lock, users = entry
+        users[0] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            users[0] -= 1
+            if not users[0]:
+                del self._locks[phone_number]
+    
+    def _cached_reply(self, key: str) -> Optional[str]:
+        """Obtiene la respuesta cacheada para un mensaje normalizado (None si no existe o expiró)."""
+        entry = self._reply_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._reply_cache[key]
+            return None
+        self._reply_cache.move_to_end(key)
+        self._reply_cache_hits += 1
+        return entry[1]
+    
+    def _cache_reply(self, key: str, reply: str):
+        """Guarda la respuesta a un mensaje normalizado, descartando la menos usada si se llena."""
+        self._reply_cache[key] = (time.monotonic() + REPLY_CACHE_TTL_SECONDS, reply)
+        self._reply_cache.move_to_end(key)
+        if len(self._reply_cache) > REPLY_CACHE_MAX_SIZE:
+            self._reply_cache.popitem(last=False)
     
     async def _transcribe_audio(self, audio_bytes: bytes, source_format: str = "ogg") -> Optional[str]:
         """
         Transcribe audio a texto usando Azure OpenAI Audio Transcription API (gpt-4o-transcribe).
-        Usa HTTPClient.post_multipart para enviar audio en formato multipart/form-data.
+        Envía el audio como multipart/form-data por el cliente httpx compartido (reutiliza conexiones).
         
         Args:
             audio_bytes: Audio en bytes (puede ser OGG, WAV, MP3, etc.)
@@ -100,23 +395,18 @@ Información importante:
                 'response_format': 'text'
             }
             
-            # Crear cliente HTTP con timeout de 60 segundos
-            http_client = HTTPClient(timeout=60)
-            
-            # Hacer la petición POST multipart usando HTTPClient
-            response = await http_client.post_multipart(
+            # Hacer la petición POST multipart con el pool compartido (timeout de 60 segundos)
+            response = await get_shared_httpx().post(
                 url,
                 files=files,
-                fields=fields,
-                headers=headers
+                data=fields,
+                headers=headers,
+                timeout=60.0
             )
             
-            # Log del status
-            
-            if response.status == 200:
+            if response.status_code == 200:
                 # La respuesta es texto plano con la transcripción
-                transcription = await response.text()
-                transcription = transcription.strip()
+                transcription = response.text.strip()
                 
                 if transcription:
                     return transcription
@@ -125,51 +415,14 @@ Información importante:
                     return None
             else:
                 # Log del error
-                error_text = await response.text()
-                logger.error(f"❌ Error en transcripción {response.status}: {error_text}")
+                logger.error("❌ Error en transcripción %s: %s", response.status_code, response.text)
                 return None
                     
         except Exception as e:
-            logger.error(f"❌ Error transcribiendo audio: {str(e)}", exc_info=True)
+            logger.error("❌ Error transcribiendo audio: %s", e, exc_info=True)
             return None
         
-    @property
-    def client(self) -> AsyncAzureOpenAI:
-        """Cliente de Azure OpenAI con lazy loading y timeout configurado."""
-        if self._client is None:
-            from app.core.config import settings
-            import httpx
-            
-            # AsyncAzureOpenAI requiere un httpx.AsyncClient específicamente
-            # No podemos usar nuestro HTTPClient (basado en aiohttp) directamente
-            # Pero configuramos timeout extendido (60 segundos para multimodal)
-            http_client = httpx.AsyncClient(
-                timeout=httpx.Timeout(60.0, connect=10.0)
-            )
-            
-            self._client = AsyncAzureOpenAI(
-                api_key=settings.azure_openai_api_key,
-                api_version=settings.azure_openai_api_version,
-                azure_endpoint=settings.azure_openai_endpoint,
-                http_client=http_client  # Cliente HTTP custom con timeout aumentado
-            )
-        return self._client
-    
-    def _get_conversation_history(self, phone_number: str) -> List[Dict[str, str]]:
-        """
-        Obtiene el historial de conversación para un número de teléfono.
-        
-        Args:
-            phone_number: Número de teléfono del usuario
-            
-        Returns:
-            Lista de mensajes del historial
-        """
-        if phone_number not in self._conversation_history:
-            self._conversation_history[phone_number] = []
-        return self._conversation_history[phone_number]
-    
-    def _add_to_history(
+    async def _add_to_history(
         self,
         phone_number: str,
         role: str,
@@ -183,99 +436,182 @@ Información importante:
             role: Rol del mensaje ('user' o 'assistant')
             content: Contenido del mensaje
         """
-        history = self._get_conversation_history(phone_number)
-        history.append({"role": role, "content": content})
+        tokens = _count_tokens(content) + TOKENS_PER_MESSAGE
+        await self._store.append(phone_number, role, content, tokens)
+        # El historial solo conserva lo reciente: la conversación completa se archiva en background
+        conversation_archive.add(phone_number, role, content)
+    
+    def _select_history(self, history: List[Tuple[str, str, int]], max_tokens: int) -> List[Dict[str, str]]:
+        """
+        Selecciona los mensajes más recientes que caben en el presupuesto de tokens.
+        
+        Args:
+            history: Historial completo (del más antiguo al más reciente)
+            max_tokens: Tokens disponibles para el historial
+            
+        Returns:
+            Mensajes en el formato de la API, en orden cronológico
+        """
+        selected: List[Dict[str, str]] = []
+        total_tokens = 0
+        for role, content, tokens in reversed(history):
+            total_tokens += tokens
+            if total_tokens > max_tokens or len(selected) >= self.max_history_messages:
+                break
+            selected.append({"role": role, "content": content})
+        selected.reverse()
+        return selected
+    
+    def _schedule_summary(self, phone_number: str, summary: Optional[str], turns: List[Tuple[str, str, int]]):
+        """Resume en segundo plano los mensajes más antiguos si no hay un resumen en curso."""
+        if phone_number in self._summary_tasks:
+            return
+        task = asyncio.create_task(self._summarize(phone_number, summary, turns))
+        self._summary_tasks[phone_number] = task
+        
+        def forget(done: asyncio.Task):
+            if self._summary_tasks.get(phone_number) is done:
+                del self._summary_tasks[phone_number]
+        
+        task.add_done_callback(forget)
+    
+    async def _summarize(self, phone_number: str, summary: Optional[str], turns: List[Tuple[str, str, int]]):
+        """
+        Resume los mensajes más antiguos de una conversación (junto con el resumen anterior)
+        y los reemplaza por el resumen en el historial.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+            summary: Resumen anterior de la conversación (opcional)
+            turns: Mensajes a resumir, del más antiguo al más reciente
+        """
+        transcript = "\n".join(
+            f"{'Usuario' if role == 'user' else 'Asistente'}: {content}" for role, content, _ in turns
+        )
+        if summary:
+            transcript = f"Resumen anterior: {summary}\n\n{transcript}"
         
-        # Limitar el historial al máximo configurado
-        if len(history) > self.max_history_messages:
-            # Mantener el mensaje del sistema y eliminar los más antiguos
-            self._conversation_history[phone_number] = history[-self.max_history_messages:]
+        try:
+            async with asyncio.timeout(CHAT_COMPLETION_DEADLINE_SECONDS):
+                response = await self.client.chat.completions.create(
+                    model=self._deployment_name,
+                    messages=(
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": transcript}
+                    ),
+                    max_completion_tokens=SUMMARY_MAX_COMPLETION_TOKENS,
+                    reasoning_effort=self._reasoning_effort,
+                    timeout=CHAT_COMPLETION_TIMEOUT_SECONDS
+                )
+        except (openai.APIError, asyncio.TimeoutError) as e:
+            # Sin resumen el historial sigue acotado por max_history_messages
+            logger.warning("⚠️ No se pudo resumir la conversación de %s: %s", phone_number, e)
+            return
+        
+        content = response.choices[0].message.content if response.choices else None
+        new_summary = content.strip() if content else ""
+        if not new_summary:
+            logger.warning("⚠️ Resumen vacío para la conversación de %s", phone_number)
+            return
+        if len(new_summary) > SUMMARY_MAX_CHARS:
+            new_summary = new_summary[:SUMMARY_MAX_CHARS]
+            cut = _sentence_split_point(new_summary)
+            if cut:
+                new_summary = new_summary[:cut]
+            new_summary = new_summary.strip()
+        
+        await self._store.summarize(phone_number, new_summary, len(turns))
+        logger.info("📝 %d mensajes resumidos para %s", len(turns), phone_number)
     
-    def clear_history(self, phone_number: str):
+    async def clear_history(self, phone_number: str):
         """
         Limpia el historial de conversación de un usuario.
         
         Args:
             phone_number: Número de teléfono del usuario
         """
-        if phone_number in self._conversation_history:
-            del self._conversation_history[phone_number]
+        task = self._summary_tasks.pop(phone_number, None)
+        if task:
+            task.cancel()
+        await self._store.clear(phone_number)
     
-    async def generate_response(
+    async def start(self):
+        """Inicia la limpieza periódica del historial y el archivo de conversaciones."""
+        # Cargar tiktoken fuera del event loop (puede descargar el BPE): si no, la primera
+        # solicitud lo haría de forma síncrona y bloquearía a todas las demás
+        await asyncio.to_thread(lambda: self._max_history_tokens)
+        await self._store.start()
+        await conversation_archive.start()
+    
+    async def stop(self):
+        """Detiene la limpieza periódica del historial, los resúmenes en curso y el archivo."""
+        for task in list(self._summary_tasks.values()):
+            task.cancel()
+        await self._store.stop()
+        await conversation_archive.stop()
+    
+    async def _prepare_messages(
         self,
         user_message: str,
         phone_number: str,
-        contact_name: Optional[str] = None,
         image_data: Optional[bytes] = None,
         audio_data: Optional[bytes] = None,
         media_type: Optional[str] = None
-    ) -> str:
+    ) -> Tuple[Dict[str, Any], ...]:
         """
-        Genera una respuesta inteligente usando Azure OpenAI.
-        Soporta procesamiento multimodal: texto, imágenes y audios.
+        Construye los mensajes para la API (sistema, historial y mensaje actual multimodal)
+        y agrega el mensaje del usuario al historial.
         
         Args:
             user_message: Mensaje de texto del usuario (puede ser caption o texto solo)
             phone_number: Número de teléfono del usuario
-            contact_name: Nombre del contacto (opcional)
             image_data: Datos de imagen en bytes (opcional)
             audio_data: Datos de audio en bytes (opcional)
             media_type: Tipo MIME del media (opcional, ej: 'image/jpeg', 'audio/ogg')
             
         Returns:
-            Respuesta generada por la IA
-            
-        Raises:
-            Exception: Si ocurre un error generando la respuesta
+            Mensajes para chat completions
         """
-        try:
-            # Construir el contenido del mensaje del usuario
+        # Construir el contenido del mensaje del usuario
+        if not image_data and not audio_data:
+            # Solo texto (la mayoría de los mensajes): contenido plano, sin armar la lista multimodal
+            # (si no hay mensaje ni media, se usa un texto por defecto)
+            user_message_content = user_message or "Hola"
+            history, summary = await asyncio.gather(
+                self._store.get(phone_number),
+                self._store.get_summary(phone_number)
+            )
+        else:
+            # Formatos del media (jpeg por defecto; ogg por defecto, el de las notas de voz de WhatsApp)
+            image_format = _IMAGE_FORMATS.get(_mime_type(media_type), "jpeg")
+            source_format = _AUDIO_FORMATS.get(_mime_type(media_type), "ogg")
+            
+            # Preparar la imagen, transcribir el audio y leer el historial en paralelo
+            image_url, transcription, history, summary = await asyncio.gather(
+                self._image_data_url(image_data, image_format) if image_data else _no_result(),
+                self._transcribe_audio(audio_data, source_format) if audio_data else _no_result(),
+                self._store.get(phone_number),
+                self._store.get_summary(phone_number)
+            )
+            
             user_content = []
             
             # Si hay imagen, agregarla al contenido
-            if image_data:
-                image_base64 = self._encode_image_to_base64(image_data)
-                
-                # Determinar el formato de la imagen
-                image_format = "jpeg"  # default
-                if media_type:
-                    if "png" in media_type.lower():
-                        image_format = "png"
-                    elif "webp" in media_type.lower():
-                        image_format = "webp"
-                
+            if image_url:
                 user_content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/{image_format};base64,{image_base64}",
+                        "url": image_url,
                         "detail": "low"  # Reduce consumo de tokens: "low" | "high" | "auto"
                         # "low" usa ~85 tokens por imagen, suficiente para WhatsApp
                     }
                 })
             
-            # Si hay audio, transcribirlo y reemplazar/complementar el user_message
+            # Si hay audio, la transcripción reemplaza/complementa el user_message
             # La transcripción se trata como si fuera el mensaje original del usuario
             # (sin prefijos como "[Audio transcrito]:" para que GPT-5 lo procese naturalmente)
             if audio_data:
-                
-                # Determinar el formato del audio original
-                source_format = "ogg"  # default para WhatsApp voice messages
-                if media_type:
-                    if "mp3" in media_type.lower():
-                        source_format = "mp3"
-                    elif "wav" in media_type.lower():
-                        source_format = "wav"
-                    elif "m4a" in media_type.lower():
-                        source_format = "m4a"
-                    elif "ogg" in media_type.lower() or "opus" in media_type.lower():
-                        source_format = "ogg"
-                
-                # Transcribir directamente con Azure OpenAI (acepta OGG y otros formatos)
-                transcription = await self._transcribe_audio(audio_data, source_format)
-                
                 if transcription:
-                    # Usar la transcripción directamente como el mensaje del usuario
-                    # Sin prefijos ni indicadores - GPT-5 lo procesa como texto normal
                     if user_message:
                         # Si ya hay mensaje de texto (caption), combinarlo con la transcripción
                         user_message = f"{user_message}\n\n{transcription}"
@@ -294,116 +630,266 @@ Información importante:
                     "type": "text",
                     "text": user_message
                 })
-            elif not image_data and not audio_data:
-                # Si no hay mensaje ni media, usar un texto por defecto
-                user_content.append({
-                    "type": "text",
-                    "text": "Hola"
-                })
             
             # Si user_content tiene un solo elemento de texto, simplificarlo
             if len(user_content) == 1 and user_content[0]["type"] == "text":
                 user_message_content = user_content[0]["text"]
             else:
                 user_message_content = user_content
-            
-            # Agregar mensaje del usuario al historial
-            self._add_to_history(phone_number, "user", user_message or "[Mensaje multimedia]")
-            
-            # Construir mensajes para la API
-            messages = [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            
-            # Agregar el historial de conversación (solo texto)
-            history = self._get_conversation_history(phone_number)
-            for hist_msg in history[:-1]:  # Excluir el último que acabamos de agregar
-                messages.append({
-                    "role": hist_msg["role"],
-                    "content": hist_msg["content"]
-                })
-            
-            # Agregar el mensaje actual (puede ser multimodal)
-            messages.append({
-                "role": "user",
-                "content": user_message_content
-            })
-            
-            media_info = []
-            if image_data:
-                media_info.append("imagen")
-            if audio_data:
-                media_info.append("audio")
-            media_str = f" con {' y '.join(media_info)}" if media_info else ""
-            
-            
-            # Obtener el deployment name de la configuración
-            from app.core.config import settings
-            deployment_name = settings.azure_openai_chat_deployment_name
-            
-            
-            # Llamar a Azure OpenAI
-            # Nota: GPT-5 (o1 reasoning model) requiere max_completion_tokens alto
-            # Los tokens se dividen entre reasoning_tokens (internos) y completion_tokens (respuesta visible)
-            # Con 500 tokens, el modelo usa todo para reasoning y devuelve contenido vacío
-            response = await self.client.chat.completions.create(
-                model=deployment_name,  # Usar el deployment de chat configurado en .env
-                messages=messages,
-                max_completion_tokens=8000,  # Aumentado significativamente para modelos o1/GPT-5
-                # GPT-5/o1 necesita espacio para reasoning_tokens + completion_tokens
-                # temperature, top_p, frequency_penalty, presence_penalty no soportados en GPT-5/o1
+        
+        # Agregar el mensaje del usuario al historial (solo texto) después de leer el historial previo
+        await self._add_to_history(phone_number, "user", user_message or "[Mensaje multimedia]")
+        
+        # Conversación larga: resumir los mensajes más antiguos para las próximas solicitudes
+        if len(history) + 1 >= SUMMARY_TRIGGER_MESSAGES:
+            self._schedule_summary(phone_number, summary, history[:SUMMARY_BATCH_MESSAGES])
+        
+        # Construir mensajes para la API: sistema, resumen de lo anterior, historial dentro
+        # del presupuesto de tokens y el mensaje actual (puede ser multimodal)
+        if not image_data and not audio_data and _GREETING_RE.match(user_message or ""):
+            # Un saludo o confirmación no se beneficia del contexto: prompt más corto y rápido
+            messages = (
+                self._system_msg,
+                {"role": "user", "content": user_message_content}
+            )
+        elif summary:
+            summary_msg = {"role": "system", "content": f"Contexto previo: {summary}"}
+            max_tokens = self._max_history_tokens - _count_tokens(summary_msg["content"]) - TOKENS_PER_MESSAGE
+            messages = (
+                self._system_msg,
+                summary_msg,
+                *self._select_history(history, max_tokens),
+                {"role": "user", "content": user_message_content}
+            )
+        else:
+            messages = (
+                self._system_msg,
+                *self._select_history(history, self._max_history_tokens),
+                {"role": "user", "content": user_message_content}
+            )
+        
+        return messages
+    
+    def _media_too_large(self, image_data: Optional[bytes], audio_data: Optional[bytes]) -> bool:
+        """True si la imagen o el audio superan el tamaño máximo (y contabiliza el rechazo)."""
+        if (image_data and len(image_data) > MAX_IMAGE_BYTES) or (audio_data and len(audio_data) > MAX_AUDIO_BYTES):
+            self._rejected_media += 1
+            logger.warning(
+                "⚠️ Media demasiado grande, no se envía a Azure OpenAI (imagen=%d bytes, audio=%d bytes)",
+                len(image_data or b""),
+                len(audio_data or b"")
+            )
+            return True
+        return False
+    
+    def _log_api_error(self, e: Exception):
+        """Registra un error de Azure OpenAI con pistas para errores de deployment."""
+        error_message = str(e)
+        logger.error("❌ Error generando respuesta de IA (%s): %s", type(e).__name__, error_message, exc_info=True)
+        
+        # Log adicional para errores comunes
+        if "deployment" in error_message.lower() or "model" in error_message.lower():
+            logger.error(
+                "⚠️  PROBLEMA DE DEPLOYMENT: El deployment '%s' puede no estar disponible o no ser compatible con Chat Completions",
+                self._deployment_name
+            )
+            logger.error("💡 SOLUCIÓN: Verifica que tengas un deployment de GPT-4 o GPT-3.5-Turbo en Azure OpenAI")
+    
+    async def _fast_response(self, messages: Tuple[Dict[str, Any], ...]) -> Optional[str]:
+        """
+        Intenta responder con el deployment rápido (ej: gpt-4o-mini).
+        
+        Returns:
+            La respuesta, o None si falla, se agota el tiempo o es vacía o de baja confianza
+        """
+        try:
+            # El límite cubre también los reintentos del SDK: al escalar queda tiempo para GPT-5
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self._fast_deployment_name,
+                    messages=messages,
+                    max_completion_tokens=FAST_MODEL_MAX_COMPLETION_TOKENS
+                ),
+                timeout=FAST_MODEL_TIMEOUT_SECONDS
             )
+        except (openai.APIError, asyncio.TimeoutError) as e:
+            logger.warning("⚠️ Deployment rápido no disponible (%s), escalando a GPT-5", type(e).__name__)
+            self._fast_escalations += 1
+            return None
+        
+        content = (response.choices[0].message.content or "").strip() if response.choices else ""
+        if not content or _LOW_CONFIDENCE_RE.search(content):
+            logger.info("🔀 Respuesta de baja confianza del deployment rápido, escalando a GPT-5")
+            self._fast_escalations += 1
+            return None
+        
+        self._fast_replies += 1
+        return content
+    
+    async def generate_response(
+        self,
+        user_message: str,
+        phone_number: str,
+        contact_name: Optional[str] = None,
+        image_data: Optional[bytes] = None,
+        audio_data: Optional[bytes] = None,
+        media_type: Optional[str] = None
+    ) -> str:
+        """
+        Genera una respuesta inteligente usando Azure OpenAI.
+        Soporta procesamiento multimodal: texto, imágenes y audios.
+        
+        Args:
+            user_message: Mensaje de texto del usuario (puede ser caption o texto solo)
+            phone_number: Número de teléfono del usuario
+            contact_name: Nombre del contacto (opcional)
+            image_data: Datos de imagen en bytes (opcional)
+            audio_data: Datos de audio en bytes (opcional)
+            media_type: Tipo MIME del media (opcional, ej: 'image/jpeg', 'audio/ogg')
             
-            # Log de la respuesta completa para debugging
+        Returns:
+            Respuesta generada por la IA
+        """
+        # Se consume la respuesta en streaming: un fragmento atascado corta la llamada antes
+        # del límite total (ver stream_response) y el resultado es el texto completo
+        parts = [
+            delta async for delta in self.stream_response(user_message, phone_number, image_data, audio_data, media_type)
+        ]
+        return "".join(parts).strip()
+    
+    async def stream_response(
+        self,
+        user_message: str,
+        phone_number: str,
+        image_data: Optional[bytes] = None,
+        audio_data: Optional[bytes] = None,
+        media_type: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Genera la respuesta de IA en streaming, entregando los fragmentos de texto a medida que llegan.
+        La respuesta completa se agrega al historial al terminar.
+        
+        Args:
+            user_message: Mensaje de texto del usuario (puede ser caption o texto solo)
+            phone_number: Número de teléfono del usuario
+            image_data: Datos de imagen en bytes (opcional)
+            audio_data: Datos de audio en bytes (opcional)
+            media_type: Tipo MIME del media (opcional)
             
-            # Log de uso de tokens (importante para modelos o1/GPT-5 con reasoning)
-            if hasattr(response, 'usage'):
-                usage = response.usage
-                
-                # Mostrar reasoning tokens si están disponibles (GPT-5/o1)
-                if hasattr(usage, 'completion_tokens_details'):
-                    details = usage.completion_tokens_details
-                    if hasattr(details, 'reasoning_tokens'):
-                        pass  # Logger eliminado
-
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        if self._media_too_large(image_data, audio_data):
+            yield MEDIA_TOO_LARGE_RESPONSE
+            return
+        
+        # Un mensaje por conversación a la vez: el siguiente del mismo número ve esta respuesta en su historial
+        async with self._conversation_lock(phone_number):
+            parts: List[str] = []
+            cache_key = None
+            cached = None
             
-            # Extraer la respuesta
-            if not response.choices or len(response.choices) == 0:
-                logger.warning(f"⚠️ No hay choices en la respuesta de IA")
-                ai_response = ""
-            else:
-                message_content = response.choices[0].message.content
-                ai_response = message_content.strip() if message_content else ""
+            try:
+                messages = await self._prepare_messages(user_message, phone_number, image_data, audio_data, media_type)
+                
+                # Sin media ni contexto (conversación nueva o saludo) la respuesta solo depende del
+                # mensaje y del prompt de sistema, que es fijo: se puede reutilizar
+                if len(messages) == 2 and not (image_data or audio_data):
+                    cache_key = _WHITESPACE_RE.sub(" ", (user_message or "").strip().lower()) or None
+                    cached = self._cached_reply(cache_key) if cache_key else None
+                
+                # asyncio.timeout no puede abarcar los yield de un generador: se controla el límite por fragmento
+                deadline = time.monotonic() + CHAT_COMPLETION_DEADLINE_SECONDS
+                
+                # Sin respuesta cacheada, los mensajes cortos de solo texto van primero al deployment rápido;
+                # se escala a GPT-5 si no está configurado, falla o da una respuesta vacía o de baja confianza
+                quick_response = cached
+                if quick_response is None and self._fast_deployment_name and not (image_data or audio_data) and len(user_message or "") < FAST_MODEL_MAX_CHARS:
+                    quick_response = await self._fast_response(messages)
+                
+                if quick_response:
+                    parts.append(quick_response)
+                    yield quick_response
+                else:
+                    # Nota: en GPT-5/o1 los tokens se dividen entre reasoning_tokens (internos) y completion_tokens
+                    # (respuesta visible). Con un presupuesto corto el modelo puede gastarlo todo en reasoning y
+                    # devolver contenido vacío (finish_reason="length"): solo entonces se reintenta con uno mayor
+                    # temperature, top_p, frequency_penalty, presence_penalty no soportados en GPT-5/o1
+                    for max_completion_tokens in (self._max_completion_tokens, LENGTH_RETRY_MAX_COMPLETION_TOKENS):
+                        finish_reason = None
+                        # Los reintentos del SDK (429, 5xx y timeouts, con backoff exponencial y jitter)
+                        # quedan dentro del límite total: ningún intento puede esperar más que lo que resta
+                        remaining = deadline - time.monotonic()
+                        stream = await asyncio.wait_for(
+                            self.client.chat.completions.create(
+                                model=self._deployment_name,
+                                messages=messages,
+                                max_completion_tokens=max_completion_tokens,
+                                reasoning_effort=self._reasoning_effort,
+                                timeout=min(CHAT_COMPLETION_TIMEOUT_SECONDS, max(remaining, 0.0)),
+                                stream=True,
+                                stream_options={"include_usage": True}
+                            ),
+                            timeout=remaining
+                        )
+                        
+                        # El stream se cierra al salir por cualquier motivo (error, timeout o si el consumidor
+                        # deja de iterar): no queda abierto en el pool HTTP/2 compartido hasta el GC
+                        async with stream:
+                            chunks = stream.__aiter__()
+                            while True:
+                                # Antes del primer fragmento solo aplica el límite total; después, también el de inactividad
+                                remaining = deadline - time.monotonic()
+                                timeout = min(remaining, STREAM_IDLE_TIMEOUT_SECONDS) if parts else remaining
+                                try:
+                                    chunk = await asyncio.wait_for(anext(chunks), timeout=timeout)
+                                except StopAsyncIteration:
+                                    break
+                                
+                                # Log de uso de tokens (último fragmento, importante para modelos con reasoning)
+                                usage = chunk.usage
+                                if usage and logger.isEnabledFor(logging.DEBUG):
+                                    details = usage.completion_tokens_details
+                                    logger.debug(
+                                        "Tokens de IA: prompt=%s completion=%s reasoning=%s",
+                                        usage.prompt_tokens,
+                                        usage.completion_tokens,
+                                        details.reasoning_tokens if details else None
+                                    )
+                                
+                                # Azure envía fragmentos sin choices (resultados de filtros de contenido y uso)
+                                if not chunk.choices:
+                                    continue
+                                choice = chunk.choices[0]
+                                finish_reason = choice.finish_reason or finish_reason
+                                if choice.delta.content:
+                                    parts.append(choice.delta.content)
+                                    yield choice.delta.content
+                        
+                        if parts or finish_reason != "length" or max_completion_tokens >= LENGTH_RETRY_MAX_COMPLETION_TOKENS:
+                            break
+                        logger.warning(
+                            "⚠️ Respuesta de IA vacía por límite de tokens (%d), reintentando con %d",
+                            max_completion_tokens,
+                            LENGTH_RETRY_MAX_COMPLETION_TOKENS
+                        )
+                        
+            except (openai.APIError, asyncio.TimeoutError) as e:
+                self._log_api_error(e)
+                if not parts:
+                    parts.append(FALLBACK_RESPONSE)
+                    yield FALLBACK_RESPONSE
+                return
             
-            # Validar que la respuesta no esté vacía
+            ai_response = "".join(parts).strip()
             if not ai_response:
-                logger.warning(f"⚠️ Respuesta de IA vacía, usando mensaje por defecto")
-                logger.warning(f"🔍 Finish reason: {response.choices[0].finish_reason if response.choices else 'N/A'}")
-                ai_response = "¡Hola! 👋 Gracias por contactarnos. ¿En qué puedo ayudarte con Ezekl Budget?"
-            
-            # Agregar respuesta al historial
-            self._add_to_history(phone_number, "assistant", ai_response)
-            
-            
-            return ai_response
+                logger.warning("⚠️ Respuesta de IA vacía, usando mensaje por defecto")
+                ai_response = DEFAULT_RESPONSE
+                yield DEFAULT_RESPONSE
+            elif cache_key and cached is None:
+                self._cache_reply(cache_key, ai_response)
             
-        except Exception as e:
-            error_message = str(e)
-            logger.error(f"❌ Error generando respuesta de IA: {error_message}", exc_info=True)
-            logger.error(f"🔍 Tipo de error: {type(e).__name__}")
-            
-            # Log adicional para errores comunes
-            if "deployment" in error_message.lower() or "model" in error_message.lower():
-                logger.error(f"⚠️  PROBLEMA DE DEPLOYMENT: El deployment '{settings.azure_openai_deployment_name}' "
-                           f"puede no estar disponible o no ser compatible con Chat Completions")
-                logger.error(f"💡 SOLUCIÓN: Verifica que tengas un deployment de GPT-4 o GPT-3.5-Turbo en Azure OpenAI")
-            
-            # Respuesta de fallback en caso de error
-            fallback_response = (
-                "Disculpa, estoy teniendo problemas técnicos 😅. "
-                "Por favor contacta a nuestro equipo de soporte en soporte@ezeklbudget.com"
-            )
-            return fallback_response
+            await self._add_to_history(phone_number, "assistant", ai_response)
     
     async def process_and_reply(
         self,
@@ -413,11 +899,16 @@ Información importante:
         image_data: Optional[bytes] = None,
         audio_data: Optional[bytes] = None,
         media_type: Optional[str] = None,
-        send_via_whatsapp: bool = True
-    ) -> Dict[str, any]:
+        send_via_whatsapp: bool = True,
+        message_id: Optional[str] = None
+    ) -> ReplyResult:
         """
         Procesa un mensaje (texto, imagen o audio) y opcionalmente envía una respuesta por WhatsApp.
         
+        Al enviar por WhatsApp la respuesta se genera en streaming (salvo que
+        azure_openai_stream_responses esté desactivado): si es larga, el primer bloque
+        se envía en cuanto está listo y el resto como un segundo mensaje.
+        
         Args:
             user_message: Mensaje de texto del usuario (puede ser caption)
             phone_number: Número de teléfono del usuario (o identificador único)
@@ -426,60 +917,103 @@ Información importante:
             audio_data: Datos de audio en bytes (opcional)
             media_type: Tipo MIME del media (opcional)
             send_via_whatsapp: Si es True, envía la respuesta por WhatsApp (default: True)
+            message_id: ID del mensaje recibido; si se indica, se muestra "escribiendo..." mientras se genera la respuesta
             
         Returns:
             Dict con el resultado del procesamiento
         """
         try:
-            # Generar respuesta de IA (puede procesar texto, imagen o audio)
-            ai_response = await self.generate_response(
-                user_message=user_message,
-                phone_number=phone_number,
-                contact_name=contact_name,
-                image_data=image_data,
-                audio_data=audio_data,
-                media_type=media_type
-            )
-            
-            result = {
+            result: ReplyResult = {
                 "success": True,
-                "ai_response": ai_response,
                 "processed_media": {
                     "has_image": bool(image_data),
                     "has_audio": bool(audio_data)
                 }
             }
             
-            # Enviar respuesta por WhatsApp solo si se solicita
-            if send_via_whatsapp:
-                from app.services.whatsapp_service import whatsapp_service
-                
-                media_info = []
-                if image_data:
-                    media_info.append("imagen")
-                if audio_data:
-                    media_info.append("audio")
-                media_str = f" ({' y '.join(media_info)})" if media_info else ""
-                
-                
-                whatsapp_response = await whatsapp_service.send_text_message(
-                    to=phone_number,
-                    body=ai_response
+            if not send_via_whatsapp:
+                # Generar respuesta de IA (puede procesar texto, imagen o audio)
+                result["ai_response"] = await self.generate_response(
+                    user_message=user_message,
+                    phone_number=phone_number,
+                    contact_name=contact_name,
+                    image_data=image_data,
+                    audio_data=audio_data,
+                    media_type=media_type
                 )
-                
-                result["whatsapp_message_id"] = whatsapp_response.messages[0]['id'] if whatsapp_response.messages else None
-                
+                return result
+            
+            # El indicador de escritura corre mientras se genera la respuesta; si falla no interrumpe el flujo
+            typing_task = asyncio.create_task(whatsapp_service.send_typing_indicator(message_id)) if message_id else None
+            
+            message_ids: List[Optional[str]] = []
+            
+            async def send(body: str):
+                whatsapp_response = await whatsapp_service.send_text_message(to=phone_number, body=body)
+                message_ids.append(whatsapp_response.messages[0]['id'] if whatsapp_response.messages else None)
+            
+            parts: List[str] = []
+            pending: List[str] = []
+            pending_chars = 0
+            # El primer bloque se envía en paralelo: el streaming sigue mientras WhatsApp responde
+            first_send: Optional[asyncio.Task] = None
+            
+            try:
+                if settings.azure_openai_stream_responses:
+                    # aclosing libera el lock de la conversación aunque falle un envío a mitad del streaming
+                    async with aclosing(self.stream_response(user_message, phone_number, image_data, audio_data, media_type)) as stream:
+                        async for delta in stream:
+                            parts.append(delta)
+                            pending.append(delta)
+                            pending_chars += len(delta)
+                            if first_send is not None or pending_chars < STREAM_FIRST_MESSAGE_CHARS:
+                                continue
+                            
+                            # Enviar el primer bloque cortando en el último fin de oración disponible
+                            text = "".join(pending)
+                            cut = _sentence_split_point(text)
+                            if cut:
+                                first_send = asyncio.create_task(send(text[:cut].strip()))
+                                pending = [text[cut:]]
+                            else:
+                                pending = [text]
+                else:
+                    # Sin streaming: la respuesta completa se envía en un solo mensaje
+                    parts.append(await self.generate_response(
+                        user_message=user_message,
+                        phone_number=phone_number,
+                        contact_name=contact_name,
+                        image_data=image_data,
+                        audio_data=audio_data,
+                        media_type=media_type
+                    ))
+                    pending = list(parts)
+            finally:
+                if typing_task is not None:
+                    await typing_task
+                # El resto se envía después del primer bloque para respetar el orden
+                if first_send is not None:
+                    await first_send
+            
+            # Enviar lo que falte (o la respuesta completa si fue corta)
+            remainder = "".join(pending).strip()
+            if remainder:
+                await send(remainder)
+            
+            result["ai_response"] = "".join(parts).strip()
+            result["whatsapp_message_id"] = message_ids[0] if message_ids else None
+            result["whatsapp_message_ids"] = message_ids
             
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error procesando y respondiendo mensaje: {str(e)}", exc_info=True)
+            logger.error("❌ Error procesando y respondiendo mensaje: %s", e, exc_info=True)
             return {
                 "success": False,
                 "error": str(e)
             }
     
-    def get_statistics(self) -> Dict[str, any]:
+    def get_statistics(self) -> Dict[str, Any]:
         """
         Obtiene estadísticas del servicio de IA.
         
@@ -487,9 +1021,17 @@ Información importante:
             Dict con estadísticas
         """
         return {
-            "active_conversations": len(self._conversation_history),
-            "total_messages": sum(len(history) for history in self._conversation_history.values()),
-            "max_history_per_conversation": self.max_history_messages
+            # Con Redis el historial vive fuera del proceso: solo se reporta lo que hay en memoria
+            "history_storage": "redis" if self._store.uses_redis else "memory",
+            **self._store.local_statistics(),
+            "max_history_per_conversation": self.max_history_messages,
+            "max_history_tokens": self._max_history_tokens,
+            "rejected_media": self._rejected_media,
+            "reply_cache_size": len(self._reply_cache),
+            "reply_cache_hits": self._reply_cache_hits,
+            "fast_replies": self._fast_replies,
+            "fast_escalations": self._fast_escalations,
+            "archive": conversation_archive.get_stats()
         }
 
 
@@ -0,0 +1,131 @@
+"""
+Archivo histórico de las conversaciones de WhatsApp con la IA.
+Guarda cada mensaje en la base de datos en background, sin bloquear la respuesta al usuario.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.database.connection import execute_sp
+
+logger = logging.getLogger(__name__)
+
+# Mensajes pendientes de guardar; si la cola está llena se descartan (nunca se bloquea la respuesta)
+ARCHIVE_QUEUE_MAX_SIZE = 1024
+# Máximo de mensajes por llamada al stored procedure
+ARCHIVE_BATCH_MAX_SIZE = 100
+
+
+@dataclass
+class ArchivedMessage:
+    """Mensaje de una conversación pendiente de guardar"""
+    phone_number: str
+    role: str
+    content: str
+    created_at: datetime = field(default_factory=datetime.now)
+
+
+class ConversationArchive:
+    """
+    Cola asíncrona que guarda los mensajes de las conversaciones en la base de datos.
+
+    El historial en Redis/memoria solo conserva los mensajes recientes; este archivo
+    conserva la conversación completa para análisis y soporte. Los mensajes se agrupan
+    en lotes para hacer una sola llamada a spWhatsAppMessageAdd por lote.
+    """
+
+    def __init__(self, max_size: int = ARCHIVE_QUEUE_MAX_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.worker_task: Optional[asyncio.Task] = None
+        self.saved_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+
+    def add(self, phone_number: str, role: str, content: str) -> bool:
+        """
+        Agrega un mensaje a la cola para guardarlo en background.
+
+        Args:
+            phone_number: Número de teléfono del usuario
+            role: Rol del mensaje ('user' o 'assistant')
+            content: Contenido del mensaje
+
+        Returns:
+            True si se agregó, False si la cola está llena (el mensaje se descarta)
+        """
+        try:
+            self.queue.put_nowait(ArchivedMessage(phone_number, role, content))
+            return True
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            if self.dropped_count % 100 == 1:
+                logger.warning("⚠️ Cola del archivo de conversaciones llena, %d mensajes descartados", self.dropped_count)
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtiene estadísticas de la cola"""
+        return {
+            "is_running": self.worker_task is not None and not self.worker_task.done(),
+            "queue_size": self.queue.qsize(),
+            "saved_count": self.saved_count,
+            "failed_count": self.failed_count,
+            "dropped_count": self.dropped_count
+        }
+
+    async def _save(self, batch: List[ArchivedMessage]):
+        """Guarda un lote de mensajes; los errores se registran sin detener el worker."""
+        try:
+            await execute_sp("spWhatsAppMessageAdd", {
+                "messages": [
+                    {
+                        "phoneNumber": message.phone_number,
+                        "role": message.role,
+                        "content": message.content,
+                        "createdAt": message.created_at.isoformat()
+                    }
+                    for message in batch
+                ]
+            })
+            self.saved_count += len(batch)
+        except Exception as e:
+            self.failed_count += len(batch)
+            logger.error("❌ Error guardando %d mensajes de conversación: %s", len(batch), e)
+
+    def _drain(self, batch: List[ArchivedMessage]):
+        """Completa el lote con los mensajes que ya están en la cola."""
+        while len(batch) < ARCHIVE_BATCH_MAX_SIZE and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+    async def _worker(self):
+        """Worker que guarda los mensajes en lotes"""
+        while True:
+            batch = [await self.queue.get()]
+            self._drain(batch)
+            await self._save(batch)
+
+    async def start(self):
+        """Inicia el worker de la cola"""
+        if self.worker_task is None or self.worker_task.done():
+            self.worker_task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """Detiene el worker y guarda los mensajes que quedaron en la cola"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+        while not self.queue.empty():
+            batch: List[ArchivedMessage] = []
+            self._drain(batch)
+            await self._save(batch)
+
+
+# Instancia global del archivo de conversaciones
+conversation_archive = ConversationArchive()
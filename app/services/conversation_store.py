@@ -0,0 +1,304 @@
+"""
+Almacenamiento del historial de conversaciones del servicio de IA.
+Usa Redis (compartido entre workers y persistente entre reinicios) y, si Redis
+no está disponible, un caché LRU en la memoria del proceso.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.core.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las listas de historial en Redis (una por número de teléfono)
+REDIS_HISTORY_KEY_PREFIX = "wa:hist:"
+# Prefijo del resumen de los mensajes antiguos de cada conversación
+REDIS_SUMMARY_KEY_PREFIX = "wa:summary:"
+
+# Conversaciones sin actividad por más de este tiempo se descartan
+CONVERSATION_TTL_SECONDS = 24 * 60 * 60
+# Máximo por defecto de conversaciones en memoria cuando no hay Redis (se descarta la menos reciente)
+MAX_ACTIVE_CONVERSATIONS = 10000
+# Frecuencia de la limpieza de conversaciones inactivas en memoria
+CONVERSATION_CLEANUP_INTERVAL_SECONDS = 15 * 60
+
+# Caché en memoria delante de Redis para conversaciones activas
+HISTORY_CACHE_MAX_SIZE = 1024
+HISTORY_CACHE_TTL_SECONDS = 900
+
+# Roles del historial compacto (índice guardado en cada mensaje)
+ROLES = ("user", "assistant")
+ROLE_IDS = {role: index for index, role in enumerate(ROLES)}
+
+# Mensaje del historial: (rol, contenido, tokens estimados)
+HistoryMessage = Tuple[str, str, int]
+
+
+class ConversationStore:
+    """
+    Historial de conversación por número de teléfono, acotado a max_messages.
+    
+    En Redis cada mensaje se guarda como [id de rol, contenido, tokens] en una lista
+    que se recorta y expira en cada escritura; las conversaciones activas se mantienen
+    además en un caché LRU del proceso para evitar el viaje a Redis en cada mensaje
+    (el caché asume que los mensajes de un número llegan al mismo proceso, como con un
+    solo worker de uvicorn). En memoria se guarda como tupla (id de rol, contenido UTF-8,
+    tokens) para minimizar el overhead por mensaje.
+    
+    Opcionalmente cada conversación tiene un resumen de sus mensajes más antiguos,
+    que reemplaza a esos mensajes en el historial (ver summarize).
+    """
+    
+    def __init__(
+        self,
+        max_messages: int,
+        ttl_seconds: int = CONVERSATION_TTL_SECONDS,
+        max_conversations: int = MAX_ACTIVE_CONVERSATIONS
+    ):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        
+        # Respaldo en memoria en orden LRU (la conversación más reciente al final)
+        self._local: "OrderedDict[str, Deque[Tuple[int, bytes, int]]]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}  # segundos de time.monotonic()
+        self._cleanup_task: Optional[asyncio.Task] = None
+        
+        # Caché delante de Redis: número -> (expira en time.monotonic(), historial)
+        self._cache: "OrderedDict[str, Tuple[float, Deque[HistoryMessage]]]" = OrderedDict()
+        # Cargas en curso desde Redis, para que solicitudes simultáneas no lean dos veces
+        self._loading: Dict[str, asyncio.Task] = {}
+        
+        # Resúmenes por número (en modo Redis, solo de las conversaciones en caché)
+        self._summaries: Dict[str, str] = {}
+    
+    @property
+    def uses_redis(self) -> bool:
+        """True si el historial se guarda en Redis."""
+        return redis_client.is_connected
+    
+    async def get(self, phone_number: str) -> List[HistoryMessage]:
+        """
+        Obtiene el historial de un número, del mensaje más antiguo al más reciente.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+            
+        Returns:
+            Lista de mensajes (rol, contenido, tokens)
+        """
+        if self.uses_redis:
+            cached = self._cache.get(phone_number)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(phone_number)
+                return list(cached[1])
+            
+            task = self._loading.get(phone_number)
+            if task is None:
+                task = asyncio.create_task(self._load(phone_number))
+                self._loading[phone_number] = task
+                task.add_done_callback(lambda _: self._loading.pop(phone_number, None))
+            return list(await asyncio.shield(task))
+        
+        history = self._local.get(phone_number)
+        if history is None:
+            return []
+        self._touch(phone_number)
+        return [(ROLES[role_id], content.decode(), tokens) for role_id, content, tokens in history]
+    
+    async def append(self, phone_number: str, role: str, content: str, tokens: int):
+        """
+        Agrega un mensaje al historial, descartando los más antiguos al superar max_messages.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+            role: Rol del mensaje ('user' o 'assistant')
+            content: Contenido del mensaje
+            tokens: Tokens estimados del mensaje
+        """
+        role_id = ROLE_IDS[role]
+        
+        if self.uses_redis:
+            # Actualizar el caché en el lugar (si la conversación está cargada) antes de escribir en Redis
+            cached = self._cache.get(phone_number)
+            if cached is not None:
+                # El deque descarta el mensaje más antiguo sin copiar la lista
+                history = cached[1]
+                history.append((role, content, tokens))
+                self._cache[phone_number] = (time.monotonic() + HISTORY_CACHE_TTL_SECONDS, history)
+                self._cache.move_to_end(phone_number)
+            
+            await redis_client.list_append(
+                REDIS_HISTORY_KEY_PREFIX + phone_number,
+                [orjson.dumps([role_id, content, tokens]).decode()],
+                max_length=self.max_messages,
+                expires_in_seconds=self.ttl_seconds,
+                related_keys=(REDIS_SUMMARY_KEY_PREFIX + phone_number,) if phone_number in self._summaries else ()
+            )
+            return
+        
+        history = self._local.get(phone_number)
+        if history is None:
+            history = deque(maxlen=self.max_messages)
+            self._local[phone_number] = history
+            if len(self._local) > self.max_conversations:
+                oldest, _ = self._local.popitem(last=False)
+                self._last_seen.pop(oldest, None)
+                self._summaries.pop(oldest, None)
+        
+        # El deque descarta automáticamente los mensajes más antiguos al llegar al máximo
+        history.append((role_id, content.encode(), tokens))
+        self._touch(phone_number)
+    
+    async def get_summary(self, phone_number: str) -> Optional[str]:
+        """
+        Obtiene el resumen de los mensajes antiguos de un número.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+            
+        Returns:
+            Resumen, o None si la conversación no tiene
+        """
+        if self.uses_redis and phone_number not in self._cache:
+            value = await redis_client.get(REDIS_SUMMARY_KEY_PREFIX + phone_number)
+            return value["text"] if value else None
+        return self._summaries.get(phone_number)
+    
+    async def summarize(self, phone_number: str, summary: str, count: int):
+        """
+        Guarda el resumen de una conversación y descarta los count mensajes más antiguos,
+        que quedan cubiertos por el resumen.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+            summary: Resumen de los mensajes antiguos (incluye el resumen anterior)
+            count: Cantidad de mensajes resumidos
+        """
+        if self.uses_redis:
+            cached = self._cache.get(phone_number)
+            if cached is not None:
+                self._summaries[phone_number] = summary
+                for _ in range(min(count, len(cached[1]))):
+                    cached[1].popleft()
+            
+            await redis_client.set(
+                REDIS_SUMMARY_KEY_PREFIX + phone_number,
+                {"text": summary},
+                expires_in_seconds=self.ttl_seconds
+            )
+            await redis_client.list_trim(REDIS_HISTORY_KEY_PREFIX + phone_number, count)
+            return
+        
+        history = self._local.get(phone_number)
+        if history is None:
+            return
+        self._summaries[phone_number] = summary
+        for _ in range(min(count, len(history))):
+            history.popleft()
+    
+    async def clear(self, phone_number: str):
+        """
+        Elimina el historial de un número.
+        
+        Args:
+            phone_number: Número de teléfono del usuario
+        """
+        self._local.pop(phone_number, None)
+        self._last_seen.pop(phone_number, None)
+        self._cache.pop(phone_number, None)
+        self._summaries.pop(phone_number, None)
+        
+        if self.uses_redis:
+            await redis_client.delete_many(
+                REDIS_HISTORY_KEY_PREFIX + phone_number,
+                REDIS_SUMMARY_KEY_PREFIX + phone_number
+            )
+    
+    async def _load(self, phone_number: str) -> Deque[HistoryMessage]:
+        """Lee el historial y el resumen desde Redis y los guarda en el caché."""
+        items, summary = await asyncio.gather(
+            redis_client.list_range(REDIS_HISTORY_KEY_PREFIX + phone_number),
+            redis_client.get(REDIS_SUMMARY_KEY_PREFIX + phone_number)
+        )
+        history = deque(
+            ((ROLES[role_id], content, tokens) for role_id, content, tokens in map(orjson.loads, items)),
+            maxlen=self.max_messages
+        )
+        
+        self._cache[phone_number] = (time.monotonic() + HISTORY_CACHE_TTL_SECONDS, history)
+        self._cache.move_to_end(phone_number)
+        if summary:
+            self._summaries[phone_number] = summary["text"]
+        else:
+            self._summaries.pop(phone_number, None)
+        if len(self._cache) > HISTORY_CACHE_MAX_SIZE:
+            oldest, _ = self._cache.popitem(last=False)
+            self._summaries.pop(oldest, None)
+        
+        return history
+    
+    def local_statistics(self) -> Dict[str, int]:
+        """Conversaciones y mensajes guardados en la memoria del proceso."""
+        return {
+            "active_conversations": len(self._local),
+            "total_messages": sum(len(history) for history in self._local.values()),
+            "summaries": len(self._summaries)
+        }
+    
+    def _touch(self, phone_number: str):
+        """Marca la conversación en memoria como la más reciente."""
+        self._local.move_to_end(phone_number)
+        self._last_seen[phone_number] = time.monotonic()
+    
+    def _remove_stale_conversations(self) -> int:
+        """
+        Descarta las conversaciones en memoria sin actividad en ttl_seconds
+        (en Redis las claves expiran por sí solas).
+        
+        Returns:
+            Cantidad de conversaciones descartadas
+        """
+        cutoff = time.monotonic() - self.ttl_seconds
+        removed = 0
+        
+        # El orden LRU garantiza que las inactivas están al inicio
+        while self._local:
+            phone_number = next(iter(self._local))
+            if self._last_seen.get(phone_number, 0.0) > cutoff:
+                break
+            self._local.pop(phone_number)
+            self._last_seen.pop(phone_number, None)
+            self._summaries.pop(phone_number, None)
+            removed += 1
+        
+        return removed
+    
+    async def _cleanup_worker(self):
+        """Limpia periódicamente las conversaciones inactivas en memoria."""
+        while True:
+            await asyncio.sleep(CONVERSATION_CLEANUP_INTERVAL_SECONDS)
+            removed = self._remove_stale_conversations()
+            if removed:
+                logger.info("🧹 %d conversaciones inactivas descartadas", removed)
+    
+    async def start(self):
+        """Inicia la limpieza periódica del historial en memoria."""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_worker())
+    
+    async def stop(self):
+        """Detiene la limpieza periódica del historial en memoria."""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
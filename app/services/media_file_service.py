@@ -3,14 +3,16 @@ Servicio para gestión de archivos multimedia.
 Maneja la lógica de negocio para archivos multimedia independientes.
 """
 
+import asyncio
 import logging
-from pathlib import Path
-from typing import Dict, Any, Optional
+import time
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from typing import Dict, Any, Optional, Tuple
 from fastapi import UploadFile
 from app.database.connection import execute_sp
 from app.utils.file_handler import (
-    get_file_info,
-    get_file_size,
+    read_upload_file,
     save_media_file,
     delete_media_file,
     get_media_base_dir
@@ -19,6 +21,63 @@ from app.utils.file_handler import (
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Caché en memoria (LRU + TTL) de rutas físicas: (idCompany, idMediaFile) -> (expires_at, Path)
+# El nombre de un archivo multimedia no cambia hasta que se elimina
+_PATH_CACHE_MAX_SIZE = 10_000
+_PATH_CACHE_TTL_SECONDS = 600
+_path_cache: "OrderedDict[Tuple[int, int], Tuple[float, Path]]" = OrderedDict()
+
+
+def _get_cached_media_file_path(id_company: int, id_media_file: int) -> Optional[Path]:
+    """Obtiene la ruta desde el caché si existe y no ha expirado."""
+    key = (id_company, id_media_file)
+    entry = _path_cache.get(key)
+    if entry is None:
+        return None
+    
+    expires_at, file_path = entry
+    if expires_at <= time.monotonic():
+        _path_cache.pop(key, None)
+        return None
+    
+    _path_cache.move_to_end(key)
+    return file_path
+
+
+def _cache_media_file_path(id_company: int, id_media_file: int, file_path: Path) -> None:
+    """Guarda la ruta en el caché, descartando la entrada menos usada si está lleno."""
+    key = (id_company, id_media_file)
+    _path_cache[key] = (time.monotonic() + _PATH_CACHE_TTL_SECONDS, file_path)
+    _path_cache.move_to_end(key)
+    if len(_path_cache) > _PATH_CACHE_MAX_SIZE:
+        _path_cache.popitem(last=False)
+
+
+def invalidate_media_file_path(id_company: int, id_media_file: int) -> None:
+    """Elimina del caché la ruta de un archivo multimedia (usar al eliminarlo)."""
+    _path_cache.pop((id_company, id_media_file), None)
+
+
+# Caché de corta duración del total de la lista paginada:
+# (idCompany, search, mediaType) -> (expires_at, total)
+# Permite pedir páginas siguientes sin recalcular el total en el stored procedure
+# (search es texto libre: el caché se limita como LRU para no crecer con cada búsqueda distinta)
+_LIST_TOTAL_TTL_SECONDS = 30
+_LIST_TOTAL_CACHE_MAX_SIZE = 1024
+_list_total_cache: "OrderedDict[Tuple[int, Optional[str], Optional[str]], Tuple[float, int]]" = OrderedDict()
+
+
+# Caché de los totales agregados (por tipo y año) de cada compañía: idCompany -> (expires_at, totales)
+_TOTALS_TTL_SECONDS = 60
+_totals_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+
+def invalidate_media_files_cache(id_company: int) -> None:
+    """Descarta los totales cacheados de una compañía (usar al crear o eliminar archivos)."""
+    for key in [key for key in _list_total_cache if key[0] == id_company]:
+        _list_total_cache.pop(key, None)
+    _totals_cache.pop(id_company, None)
+
 
 async def get_media_files(
     id_company: int,
@@ -60,8 +119,21 @@ async def get_media_files(
         if media_type:
             sp_json["mediaType"] = media_type
         
+        # Para páginas siguientes reutilizar el total ya calculado para el mismo filtro
+        total_key = (id_company, search or None, media_type or None)
+        cached_total = None
+        if page > 1:
+            entry = _list_total_cache.get(total_key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    cached_total = entry[1]
+                    sp_json["includeTotal"] = False
+                    _list_total_cache.move_to_end(total_key)
+                else:
+                    del _list_total_cache[total_key]
+        
         logger.info(f"Consultando archivos multimedia: página {page}")
-        logger.debug(f"Datos: {sp_json}")
+        logger.debug("Datos: %s", sp_json)
         
         # Ejecutar stored procedure
         result = await execute_sp("spMediaFileGet", sp_json)
@@ -70,6 +142,17 @@ async def get_media_files(
             logger.warning("No se recibió respuesta del stored procedure")
             return {"total": 0, "data": []}
         
+        if cached_total is not None:
+            result["total"] = cached_total
+        else:
+            _list_total_cache[total_key] = (
+                time.monotonic() + _LIST_TOTAL_TTL_SECONDS,
+                result.get("total", 0)
+            )
+            _list_total_cache.move_to_end(total_key)
+            if len(_list_total_cache) > _LIST_TOTAL_CACHE_MAX_SIZE:
+                _list_total_cache.popitem(last=False)
+        
         logger.info(f"Archivos multimedia obtenidos: {result.get('total', 0)}")
         return result
         
@@ -96,35 +179,37 @@ async def create_media_file(
         Exception: Si hay error en la base de datos o al guardar el archivo
     """
     try:
-        # Extraer información del archivo
-        file_info = get_file_info(file)
-        file_size = await get_file_size(file)
-        
-        # Preparar JSON para el stored procedure
-        sp_json = {
-            "idCompany": id_company,
-            "sizeMediaFile": file_size,
-            "mimetype": file_info["mimetype"],
-            "mediaType": file_info["mediaType"],
-            "extension": file_info["extension"]
-        }
-        
-        logger.info(f"Creando archivo multimedia: {file.filename}")
-        logger.debug(f"Datos: {sp_json}")
-        
-        # Ejecutar stored procedure
-        result = await execute_sp("spMediaFileAdd", sp_json)
-        
-        if not result:
-            logger.error("No se recibió respuesta del stored procedure")
-            raise Exception("Error al crear archivo multimedia")
-        
-        # Guardar archivo físicamente con el nombre de la BD
-        name_from_db = result.get('nameMediaFile')
-        if not name_from_db:
-            raise Exception("No se recibió nombre de archivo de la BD")
-        
-        await save_media_file(file, name_from_db)
+        # Leer el archivo una sola vez (contenido, tamaño e información)
+        content, file_size, file_info = await read_upload_file(file)
+        
+        with content:
+            # Preparar JSON para el stored procedure
+            sp_json = {
+                "idCompany": id_company,
+                "sizeMediaFile": file_size,
+                "mimetype": file_info["mimetype"],
+                "mediaType": file_info["mediaType"],
+                "extension": file_info["extension"]
+            }
+            
+            logger.info(f"Creando archivo multimedia: {file.filename}")
+            logger.debug("Datos: %s", sp_json)
+            
+            # Ejecutar stored procedure
+            result = await execute_sp("spMediaFileAdd", sp_json)
+            
+            if not result:
+                logger.error("No se recibió respuesta del stored procedure")
+                raise Exception("Error al crear archivo multimedia")
+            
+            # Guardar archivo físicamente con el nombre de la BD
+            name_from_db = result.get('nameMediaFile')
+            if not name_from_db:
+                raise Exception("No se recibió nombre de archivo de la BD")
+            
+            await save_media_file(content, name_from_db)
+        
+        invalidate_media_files_cache(id_company)
         
         logger.info(f"Archivo multimedia creado exitosamente con ID {result.get('idMediaFile')}")
         return result
@@ -160,7 +245,7 @@ async def delete_media_file_service(
         }
         
         logger.info(f"Eliminando archivo multimedia {id_media_file}")
-        logger.debug(f"Datos: {sp_json}")
+        logger.debug("Datos: %s", sp_json)
         
         # Ejecutar stored procedure
         result = await execute_sp("spMediaFileDel", sp_json)
@@ -169,10 +254,13 @@ async def delete_media_file_service(
             logger.error("No se recibió respuesta del stored procedure")
             raise Exception("Error al eliminar archivo multimedia")
         
+        invalidate_media_file_path(id_company, id_media_file)
+        invalidate_media_files_cache(id_company)
+        
         # Eliminar archivo físico
         path_from_db = result.get('pathMediaFile')
         if path_from_db:
-            delete_media_file(path_from_db)
+            await asyncio.to_thread(delete_media_file, path_from_db)
         
         logger.info(f"Archivo multimedia {id_media_file} eliminado exitosamente")
         return result
@@ -201,13 +289,17 @@ async def get_media_file_path(
         Exception: Si hay error en la base de datos
     """
     try:
+        cached_path = _get_cached_media_file_path(id_company, id_media_file)
+        if cached_path is not None:
+            return cached_path
+        
         # Preparar JSON para consultar el archivo
         sp_json = {
             "idCompany": id_company,
             "idMediaFile": id_media_file
         }
         
-        logger.info(f"Consultando ruta de archivo multimedia {id_media_file}")
+        logger.debug("Consultando ruta de archivo multimedia %s", id_media_file)
         
         # Ejecutar stored procedure para obtener información del archivo
         result = await execute_sp("spMediaFileGetOne", sp_json)
@@ -220,12 +312,14 @@ async def get_media_file_path(
         filename = result['nameMediaFile']
         
         # Limpiar prefijo "uploads/" si viene de BD
-        if filename.startswith('uploads/'):
-            filename = filename.replace('uploads/', '', 1)
+        db_path = PurePosixPath(filename)
+        if db_path.parts and db_path.parts[0] == 'uploads':
+            filename = str(db_path.relative_to('uploads'))
         
         file_path = media_dir / filename
+        _cache_media_file_path(id_company, id_media_file, file_path)
         
-        logger.info(f"Ruta del archivo: {file_path}")
+        logger.debug("Ruta del archivo: %s", file_path)
         return file_path
         
     except ValueError:
@@ -249,6 +343,10 @@ async def get_media_files_total(id_company: int) -> Dict[str, Any]:
         Exception: Si hay error en la base de datos
     """
     try:
+        entry = _totals_cache.get(id_company)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        
         # Preparar JSON para el stored procedure
         sp_json = {
             "idCompany": id_company
@@ -268,6 +366,8 @@ async def get_media_files_total(id_company: int) -> Dict[str, Any]:
                 "byYear": []
             }
         
+        _totals_cache[id_company] = (time.monotonic() + _TOTALS_TTL_SECONDS, result)
+        
         logger.info(f"Totales obtenidos: {result.get('quantity', 0)} archivos")
         return result
         
@@ -0,0 +1,49 @@
+"""
+Cliente compartido de Azure OpenAI.
+Una sola instancia por proceso, montada sobre el cliente httpx compartido.
+"""
+
+import logging
+from typing import Optional
+
+from openai import AsyncAzureOpenAI
+
+from app.core.config import settings
+from app.core.httpx_client import get_shared_httpx
+
+logger = logging.getLogger(__name__)
+
+# Instancia compartida (se crea en el primer uso)
+_client: Optional[AsyncAzureOpenAI] = None
+
+
+def get_openai_client() -> AsyncAzureOpenAI:
+    """
+    Obtiene el cliente de Azure OpenAI del proceso, creándolo si no existe.
+    
+    Returns:
+        AsyncAzureOpenAI: Cliente compartido
+    """
+    global _client
+    if _client is None:
+        # AsyncAzureOpenAI requiere un httpx.AsyncClient específicamente
+        # No podemos usar nuestro HTTPClient (basado en aiohttp) directamente
+        # Se usa el cliente httpx compartido del proceso (timeout de 60 segundos para multimodal)
+        _client = AsyncAzureOpenAI(
+            api_key=settings.azure_openai_api_key,
+            api_version=settings.azure_openai_api_version,
+            azure_endpoint=settings.azure_openai_endpoint,
+            http_client=get_shared_httpx(),  # Pool de conexiones compartido
+            # Reintentos con backoff exponencial y jitter en 429/5xx/timeouts (respeta Retry-After);
+            # el servicio de IA limita cada respuesta a un tiempo total, así que no se alargan sin fin
+            max_retries=settings.azure_openai_max_retries
+        )
+    return _client
+
+
+async def close_openai_client():
+    """Cierra el cliente de Azure OpenAI (también cierra el pool httpx compartido)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
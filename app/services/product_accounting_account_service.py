@@ -41,7 +41,8 @@ async def update_product_accounting_account(
         }
         
         logger.info(f"Actualizando cuentas contables del producto {id_product}")
-        logger.debug(f"Datos: {sp_json}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Datos: %s", sp_json)
         
         # Ejecutar stored procedure
         result = await execute_sp("spProductAccountingAccountEdit", sp_json)
@@ -0,0 +1,81 @@
+"""
+Servicio para edición combinada de productos.
+Actualiza cuentas contables, tipos de entrega y configuración de un producto en una sola llamada a la BD.
+"""
+
+import logging
+from typing import Dict, Any, List, Optional
+from app.database.connection import execute_sp
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+async def update_product_bundle(
+    id_product: int,
+    id_company: int,
+    accounting_accounts: Optional[List[Dict[str, Any]]] = None,
+    delivery_types: Optional[List[Dict[str, Any]]] = None,
+    configuration_data: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Actualiza en una sola transacción las cuentas contables, tipos de entrega y configuración de un producto.
+    
+    Solo se actualizan las secciones recibidas (las que no son None).
+    
+    Args:
+        id_product: ID del producto a actualizar
+        id_company: ID de la compañía
+        accounting_accounts: Lista de cuentas contables con sus configuraciones
+        delivery_types: Lista de tipos de entrega con sus configuraciones
+        configuration_data: Datos de configuración del producto
+        
+    Returns:
+        Diccionario con el resultado de la operación
+        
+    Raises:
+        ValueError: Si el producto no existe, hay error en validación o porcentajes no suman 100
+        Exception: Si hay error en la base de datos
+    """
+    try:
+        # Preparar JSON para el stored procedure
+        sp_json = {
+            "idCompany": id_company,
+            "idProduct": id_product
+        }
+        
+        if accounting_accounts is not None:
+            sp_json["accountingAccount"] = accounting_accounts
+        
+        if delivery_types is not None:
+            sp_json["deliveryType"] = delivery_types
+        
+        if configuration_data is not None:
+            sp_json["configuration"] = configuration_data
+        
+        logger.info(f"Actualizando producto {id_product} (edición combinada)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Datos: %s", sp_json)
+        
+        # Ejecutar stored procedure
+        result = await execute_sp("spProductBundleEdit", sp_json)
+        
+        if not result:
+            logger.error("No se recibió respuesta del stored procedure")
+            raise Exception("Error al actualizar el producto")
+        
+        logger.info(f"Producto {id_product} actualizado exitosamente (edición combinada)")
+        return result
+        
+    except Exception as e:
+        error_message = str(e)
+        logger.error(f"Error al actualizar el producto (edición combinada): {error_message}")
+        
+        # Verificar si es un error de porcentajes
+        if "porcentajes" in error_message.lower() and "100" in error_message:
+            raise ValueError("Los porcentajes para cada efecto deben sumar exactamente 100")
+        
+        if "no existe" in error_message.lower():
+            raise ValueError("El producto no existe")
+        
+        raise
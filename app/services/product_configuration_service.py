@@ -41,7 +41,7 @@ async def update_product_configuration(
         }
         
         logger.info(f"Actualizando configuración del producto {id_product}")
-        logger.debug(f"Datos: {sp_json}")
+        logger.debug("Datos: %s", sp_json)
         
         # Ejecutar stored procedure
         result = await execute_sp("spProductConfigurationEdit", sp_json)
@@ -3,13 +3,17 @@ Servicio para gestión de archivos multimedia de productos.
 Maneja la lógica de negocio para archivos multimedia asociados a productos.
 """
 
+import asyncio
 import logging
 from typing import Dict, Any, List
 from fastapi import UploadFile
 from app.database.connection import execute_sp
+from app.services.media_file_service import (
+    invalidate_media_file_path,
+    invalidate_media_files_cache
+)
 from app.utils.file_handler import (
-    get_file_info,
-    get_file_size,
+    read_upload_file,
     save_media_file,
     delete_media_file
 )
@@ -39,43 +43,80 @@ async def add_product_media_files(
         Exception: Si hay error en la base de datos
     """
     try:
-        # Procesar cada archivo para obtener su información
-        media_files_data = []
-        for file in files:
-            file_info = get_file_info(file)
-            file_size = await get_file_size(file)
+        # Leer cada archivo una sola vez (contenido, tamaño e información) en paralelo
+        # Si alguna lectura falla, se cierran los spools de las que sí terminaron antes de propagar el error
+        results = await asyncio.gather(*(read_upload_file(file) for file in files), return_exceptions=True)
+        error = next((r for r in results if isinstance(r, BaseException)), None)
+        if error is not None:
+            for r in results:
+                if not isinstance(r, BaseException):
+                    r[0].close()
+            raise error
+        uploads = results
+        
+        try:
+            # ordinal: el SP retorna los nombres en este orden para asociarlos con cada archivo
+            media_files_data = [
+                {
+                    "ordinal": ordinal,
+                    "sizeMediaFile": file_size,
+                    "mimetype": file_info["mimetype"],
+                    "mediaType": file_info["mediaType"],
+                    "extension": file_info["extension"]
+                }
+                for ordinal, (_, file_size, file_info) in enumerate(uploads)
+            ]
             
-            media_files_data.append({
-                "sizeMediaFile": file_size,
-                "mimetype": file_info["mimetype"],
-                "mediaType": file_info["mediaType"],
-                "extension": file_info["extension"]
-            })
-        
-        # Preparar JSON para el stored procedure
-        sp_json = {
-            "idCompany": id_company,
-            "idProduct": id_product,
-            "mediaFiles": media_files_data
-        }
-        
-        logger.info(f"Agregando {len(files)} archivos multimedia al producto {id_product}")
-        logger.debug(f"Datos: {sp_json}")
-        
-        # Ejecutar stored procedure
-        result = await execute_sp("spProductMediaFileAdd", sp_json)
-        
-        if not result:
-            logger.error("No se recibió respuesta del stored procedure")
-            raise Exception("Error al agregar archivos multimedia al producto")
-        
-        # Guardar archivos físicamente con los nombres de la BD
-        media_files_result = result.get('mediaFiles', [])
-        for i, file in enumerate(files):
-            if i < len(media_files_result):
-                name_from_db = media_files_result[i].get('nameMediaFile')
-                if name_from_db:
-                    await save_media_file(file, name_from_db)
+            # Preparar JSON para el stored procedure
+            sp_json = {
+                "idCompany": id_company,
+                "idProduct": id_product,
+                "mediaFiles": media_files_data
+            }
+            
+            logger.info(f"Agregando {len(files)} archivos multimedia al producto {id_product}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Datos: %s", sp_json)
+            
+            # Ejecutar stored procedure
+            result = await execute_sp("spProductMediaFileAdd", sp_json)
+            
+            if not result:
+                logger.error("No se recibió respuesta del stored procedure")
+                raise Exception("Error al agregar archivos multimedia al producto")
+            
+            # Guardar archivos físicamente con los nombres de la BD (en paralelo)
+            media_files_result = result.get('mediaFiles', [])
+            saves = [
+                (content, media_file['nameMediaFile'])
+                for (content, _, _), media_file in zip(uploads, media_files_result)
+                if media_file.get('nameMediaFile')
+            ]
+            # return_exceptions: todas las escrituras terminan antes de cerrar los spools
+            save_results = await asyncio.gather(
+                *(save_media_file(content, name) for content, name in saves),
+                return_exceptions=True
+            )
+            error = next((r for r in save_results if isinstance(r, BaseException)), None)
+            if error is not None:
+                # Eliminar los archivos del lote (también los parciales); los registros quedan sin archivo
+                names = [name for _, name in saves]
+                for name in names:
+                    try:
+                        delete_media_file(name)
+                    except Exception:
+                        pass
+                logger.error(
+                    "Archivos del producto %s no guardados; registros de spProductMediaFileAdd sin archivo: %s",
+                    id_product,
+                    names
+                )
+                raise error
+        finally:
+            for content, _, _ in uploads:
+                content.close()
+        
+        invalidate_media_files_cache(id_company)
         
         logger.info(f"Archivos multimedia agregados exitosamente al producto {id_product}")
         return result
@@ -137,7 +178,7 @@ async def delete_product_media_files(
         }
         
         logger.info(f"Eliminando {len(id_media_files)} archivos multimedia del producto {id_product}")
-        logger.debug(f"Datos: {sp_json}")
+        logger.debug("Datos: %s", sp_json)
         
         # Ejecutar stored procedure
         result = await execute_sp("spProductMediaFileDel", sp_json)
@@ -146,12 +187,20 @@ async def delete_product_media_files(
             logger.error("No se recibió respuesta del stored procedure")
             raise Exception("Error al eliminar archivos multimedia del producto")
         
-        # Eliminar archivos físicos
+        for id_media_file in id_media_files:
+            invalidate_media_file_path(id_company, id_media_file)
+        invalidate_media_files_cache(id_company)
+        
+        # Eliminar archivos físicos en paralelo sin bloquear el event loop
         media_files_result = result.get('mediaFiles', [])
-        for media_file in media_files_result:
-            path_from_db = media_file.get('pathMediaFile')
-            if path_from_db:
-                delete_media_file(path_from_db)
+        paths = [m['pathMediaFile'] for m in media_files_result if m.get('pathMediaFile')]
+        delete_results = await asyncio.gather(
+            *(asyncio.to_thread(delete_media_file, path) for path in paths),
+            return_exceptions=True
+        )
+        for path, delete_result in zip(paths, delete_results):
+            if isinstance(delete_result, Exception):
+                logger.error(f"No se pudo eliminar el archivo físico {path}: {str(delete_result)}")
         
         logger.info(f"Archivos multimedia eliminados exitosamente del producto {id_product}")
         return result
@@ -3,13 +3,45 @@ Servicio de autenticación para SharePoint Online usando OAuth2.
 Gestiona tokens de acceso de Azure AD para Microsoft Graph API.
 """
 
+import asyncio
 import logging
+import secrets
+import ssl
+import time
 import aiohttp
-from typing import Dict, Any
-from datetime import datetime, timedelta
+import orjson
+from functools import cached_property
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+from urllib.parse import urlencode
+
+from app.core.config import settings
+from app.core.redis import redis_client
 
 logger = logging.getLogger(__name__)
 
+# Claves de Redis para compartir el token entre workers
+REDIS_TOKEN_KEY = "sharepoint_token"
+REDIS_TOKEN_LOCK_KEY = "sharepoint_token:lock"
+# Tiempo máximo que un worker mantiene el lock de renovación
+REDIS_TOKEN_LOCK_SECONDS = 30
+# Espera máxima por el token que está renovando otro worker
+REDIS_TOKEN_WAIT_SECONDS = 5.0
+
+# Segundos antes de la expiración en que se renueva el token en segundo plano
+TOKEN_PREFETCH_SECONDS = 120
+
+# Contexto SSL reutilizado por todas las conexiones hacia Azure AD
+_ssl_context = ssl.create_default_context()
+
+
+class SharePointNotConfiguredError(RuntimeError):
+    """Faltan credenciales de Azure AD para SharePoint."""
+
+
+class SharePointAPIError(RuntimeError):
+    """Error devuelto por Azure AD o Microsoft Graph API."""
+
 
 class SharePointAuthService:
     """
@@ -21,13 +53,22 @@ class SharePointAuthService:
     
     def __init__(self):
         """Inicializa el servicio de autenticación SharePoint."""
-        from app.core.config import settings
-        
         # Cache simple de token en memoria
-        self._token_cache: Dict[str, Any] = {
-            "access_token": None,
-            "expires_at": 0,  # epoch seconds
-        }
+        self._access_token: Optional[str] = None
+        self._expires_at: float = 0.0  # segundos de time.monotonic()
+        # Se incrementa cada vez que cambia el token en caché (permite invalidar headers derivados)
+        self.token_version = 0
+        
+        # Lock para que solo una corrutina renueve el token a la vez
+        self._refresh_lock = asyncio.Lock()
+        # Tarea en segundo plano que renueva el token antes de que expire
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Valor del lock de Redis que tiene este worker (None si no lo tiene)
+        self._lock_token: Optional[str] = None
+        
+        # Connector de larga vida (DNS cacheado + keep-alive hacia login.microsoftonline.com)
+        # Se crea en el primer uso porque requiere un event loop activo
+        self._connector: Optional[aiohttp.TCPConnector] = None
         
         # Configuración de Azure AD desde variables de entorno
         # Primero intenta usar variables específicas de SharePoint, sino usa las generales
@@ -35,19 +76,33 @@ class SharePointAuthService:
         self.client_id = getattr(settings, 'sharepoint_client_id', None) or getattr(settings, 'azure_client_id', None)
         self.client_secret = getattr(settings, 'sharepoint_client_secret', None) or getattr(settings, 'azure_client_secret', None)
         
-        if not all([self.tenant_id, self.client_id, self.client_secret]):
+        if not self.is_configured:
             logger.warning("⚠️ Configuración de SharePoint incompleta. Algunos endpoints no funcionarán.")
         
-        # URLs de autenticación
-        self.token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
         # Scope para Microsoft Graph API (SharePoint Online)
         self.oauth_scope = "https://graph.microsoft.com/.default"
+        
+        # Cuerpo de la solicitud de token: constante por instancia, se codifica una sola vez
+        self._token_body = urlencode({
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "scope": self.oauth_scope
+        }).encode()
+        self._token_headers = {"Content-Type": "application/x-www-form-urlencoded"}
     
-    @property
+    @cached_property
     def is_configured(self) -> bool:
-        """Verifica si el servicio está completamente configurado."""
+        """Verifica si el servicio está completamente configurado (la configuración no cambia tras __init__)."""
         return all([self.tenant_id, self.client_id, self.client_secret])
     
+    @cached_property
+    def token_url(self) -> str:
+        """URL de autenticación de Azure AD, construida solo cuando hay tenant configurado."""
+        if not self.is_configured:
+            raise SharePointNotConfiguredError("Servicio de SharePoint no está configurado. Verifica variables de entorno.")
+        return f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
+    
     async def get_access_token(self) -> str:
         """
         Obtiene un token de acceso válido de Azure AD.
@@ -61,46 +116,231 @@ class SharePointAuthService:
         """
         # Verificar configuración
         if not self.is_configured:
-            raise Exception("Servicio de SharePoint no está configurado. Verifica variables de entorno.")
+            raise SharePointNotConfiguredError("Servicio de SharePoint no está configurado. Verifica variables de entorno.")
         
         # Verificar si hay token en caché y no ha expirado
-        now = datetime.utcnow().timestamp()
+        now = time.monotonic()
         
-        if self._token_cache["access_token"] and self._token_cache["expires_at"] > now:
-            expires_in = int(self._token_cache["expires_at"] - now)
-            logger.debug(f"🔑 Usando token de SharePoint desde caché (expira en {expires_in}s)")
-            return self._token_cache["access_token"]
+        access_token = self._access_token
+        expires_at = self._expires_at
+        if access_token and expires_at > now:
+            logger.debug(f"🔑 Usando token de SharePoint desde caché (expira en {int(expires_at - now)}s)")
+            return access_token
         
-        # Obtener nuevo token
-        logger.info("🔄 Obteniendo nuevo token de acceso para SharePoint desde Azure AD...")
+        return await self._refresh()
+    
+    def get_cached_token(self) -> Optional[str]:
+        """
+        Obtiene el token en caché sin esperar (None si no hay token vigente).
+        Permite a los llamadores evitar un await en el camino frecuente.
+        """
+        if self._access_token and self._expires_at > time.monotonic():
+            return self._access_token
+        return None
+    
+    async def _refresh(self, min_ttl: float = 0) -> str:
+        """
+        Renueva el token si el de caché vence en menos de min_ttl segundos.
         
-        token_data = {
-            "grant_type": "client_credentials",
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "scope": self.oauth_scope
-        }
+        Args:
+            min_ttl: Vigencia mínima restante para reutilizar el token actual
+            
+        Returns:
+            str: Access token válido
+        """
+        async with self._refresh_lock:
+            # Re-verificar: otra corrutina pudo haber renovado el token mientras esperábamos
+            now = time.monotonic()
+            if self._access_token and self._expires_at - now > min_ttl:
+                return self._access_token
+            
+            # Token compartido por otro worker en Redis
+            access_token = await self._get_shared_token(min_ttl)
+            if access_token:
+                self._ensure_refresh_task()
+                return access_token
+            
+            # Lock distribuido: solo un worker consulta Azure AD, los demás esperan el token en Redis
+            has_lock = await self._acquire_shared_lock()
+            if not has_lock:
+                access_token = await self._wait_for_shared_token(min_ttl)
+                if access_token:
+                    self._ensure_refresh_task()
+                    return access_token
+            
+            try:
+                access_token, expires_in = await self._request_token()
+                
+                # Almacenar en caché con 5 minutos de margen antes de expiración
+                self._access_token = access_token
+                self._expires_at = time.monotonic() + expires_in - 300
+                self.token_version += 1
+                
+                await self._store_shared_token(access_token, expires_in - 300)
+                
+                self._ensure_refresh_task()
+                return access_token
+            finally:
+                if has_lock:
+                    await self._release_shared_lock()
+    
+    def _ensure_refresh_task(self) -> None:
+        """Inicia la renovación en segundo plano si no está corriendo."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def _refresh_loop(self) -> None:
+        """Renueva el token TOKEN_PREFETCH_SECONDS antes de que expire, fuera del camino de las solicitudes."""
+        while True:
+            delay = self._expires_at - time.monotonic() - TOKEN_PREFETCH_SECONDS
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            try:
+                await self._refresh(min_ttl=TOKEN_PREFETCH_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Error renovando token de SharePoint en segundo plano: {str(e)}")
+                await asyncio.sleep(30)
+    
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        """Obtiene el connector compartido, creándolo si no existe o fue cerrado."""
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                ssl=_ssl_context,
+                ttl_dns_cache=3600,
+                keepalive_timeout=90,
+                happy_eyeballs_delay=0.25,
+                limit=10
+            )
+        return self._connector
+    
+    async def close(self):
+        """Detiene la renovación en segundo plano y cierra el connector compartido (llamar al apagar la aplicación)."""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        self._refresh_task = None
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.token_url, data=token_data) as response:
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._connector = None
+    
+    async def _request_token(self) -> Tuple[str, int]:
+        """
+        Solicita un nuevo token a Azure AD.
+        
+        Returns:
+            Tuple[str, int]: Access token y su vigencia en segundos
+            
+        Raises:
+            Exception: Si falla la autenticación con Azure AD
+        """
+        logger.info("🔄 Obteniendo nuevo token de acceso para SharePoint desde Azure AD...")
+        
+        async with aiohttp.ClientSession(connector=self._get_connector(), connector_owner=False) as session:
+            async with session.post(
+                self.token_url,
+                data=self._token_body,
+                headers=self._token_headers
+            ) as response:
                 if response.status != 200:
                     error_detail = await response.text()
                     logger.error(f"❌ Error obteniendo token de SharePoint: {response.status} - {error_detail}")
-                    raise Exception(f"Error de autenticación con Azure AD: {response.status}")
+                    raise SharePointAPIError(f"Error de autenticación con Azure AD: {response.status}")
                 
-                token_response = await response.json()
+                token_response = orjson.loads(await response.read())
                 access_token = token_response.get("access_token")
                 expires_in = token_response.get("expires_in", 3600)
-            
-            # Almacenar en caché con 5 minutos de margen antes de expiración
-            expires_at = (datetime.utcnow() + timedelta(seconds=expires_in - 300)).timestamp()
-            
-            self._token_cache["access_token"] = access_token
-            self._token_cache["expires_at"] = expires_at
-            
-            logger.info(f"✅ Token de SharePoint obtenido exitosamente (válido por {expires_in}s)")
-            
-            return access_token
+        
+        logger.info(f"✅ Token de SharePoint obtenido exitosamente (válido por {expires_in}s)")
+        return access_token, expires_in
+    
+    # ==================== TOKEN COMPARTIDO (REDIS) ====================
+    # Redis es una optimización: si no está disponible se sigue con el caché local
+    
+    async def _get_shared_token(self, min_ttl: float = 0) -> Optional[str]:
+        """Obtiene el token compartido en Redis (si le quedan más de min_ttl segundos) y lo copia al caché local."""
+        if not redis_client.is_connected:
+            return None
+        
+        try:
+            data = await redis_client.get(REDIS_TOKEN_KEY)
+            ttl = await redis_client.ttl(REDIS_TOKEN_KEY)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el token de SharePoint desde Redis: {str(e)}")
+            return None
+        
+        if not isinstance(data, dict) or not data.get("access_token") or ttl <= min_ttl:
+            return None
+        
+        self._access_token = data["access_token"]
+        self._expires_at = time.monotonic() + ttl
+        self.token_version += 1
+        logger.debug(f"🔑 Usando token de SharePoint desde Redis (expira en {ttl}s)")
+        return self._access_token
+    
+    async def _store_shared_token(self, access_token: str, expires_in_seconds: int) -> None:
+        """Guarda el token en Redis para que lo usen los demás workers."""
+        if not redis_client.is_connected or expires_in_seconds <= 0:
+            return
+        
+        try:
+            await redis_client.set(
+                REDIS_TOKEN_KEY,
+                {"access_token": access_token},
+                expires_in_seconds=expires_in_seconds
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el token de SharePoint en Redis: {str(e)}")
+    
+    async def _acquire_shared_lock(self) -> bool:
+        """Intenta tomar el lock de renovación entre workers (True si no hay Redis)."""
+        if not redis_client.is_connected:
+            return True
+        
+        # Valor único por adquisición: al liberar solo se borra el lock si sigue siendo de este worker
+        lock_token = secrets.token_hex(16)
+        try:
+            acquired = await redis_client.set_if_not_exists(
+                REDIS_TOKEN_LOCK_KEY, lock_token, expires_in_seconds=REDIS_TOKEN_LOCK_SECONDS
+            )
+            if acquired:
+                self._lock_token = lock_token
+            return acquired
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo tomar el lock de token de SharePoint en Redis: {str(e)}")
+            return True
+    
+    async def _release_shared_lock(self) -> None:
+        """
+        Libera el lock de renovación entre workers, solo si sigue siendo de este worker
+        (si la solicitud superó el TTL, otro worker puede tenerlo ya).
+        """
+        lock_token, self._lock_token = self._lock_token, None
+        if lock_token is None or not redis_client.is_connected:
+            return
+        
+        try:
+            await redis_client.delete_if_equals(REDIS_TOKEN_LOCK_KEY, lock_token)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo liberar el lock de token de SharePoint en Redis: {str(e)}")
+    
+    async def _wait_for_shared_token(self, min_ttl: float = 0) -> Optional[str]:
+        """Espera a que el worker que tiene el lock publique el token en Redis."""
+        deadline = time.monotonic() + REDIS_TOKEN_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            access_token = await self._get_shared_token(min_ttl)
+            if access_token:
+                return access_token
+        
+        logger.warning("⚠️ Tiempo de espera agotado por el token de SharePoint de otro worker")
+        return None
     
     def get_token_info(self) -> Dict[str, Any]:
         """
@@ -109,24 +349,32 @@ class SharePointAuthService:
         Returns:
             dict: Información del token (expires_at, expires_in_seconds, is_valid)
         """
-        now = datetime.utcnow().timestamp()
-        expires_at = datetime.fromtimestamp(self._token_cache["expires_at"]).isoformat() if self._token_cache["expires_at"] else None
-        expires_in = int(self._token_cache["expires_at"] - now) if self._token_cache["expires_at"] > now else 0
+        now = time.monotonic()
+        access_token = self._access_token
+        cached_expires_at = self._expires_at
+        expires_in = int(cached_expires_at - now) if cached_expires_at > now else 0
+        
+        # expires_at es relativo al reloj monotónico; convertir a hora de pared solo para mostrarlo
+        expires_at = None
+        if cached_expires_at:
+            expires_at = datetime.fromtimestamp(time.time() + cached_expires_at - now).isoformat()
         
         return {
-            "has_token": bool(self._token_cache["access_token"]),
+            "has_token": bool(access_token),
             "expires_at": expires_at,
             "expires_in_seconds": expires_in,
-            "is_valid": self._token_cache["expires_at"] > now if self._token_cache["access_token"] else False
+            "is_valid": cached_expires_at > now if access_token else False
         }
     
     def clear_token_cache(self):
-        """Limpia el caché de token (útil para testing o troubleshooting)."""
+        """
+        Limpia el caché local de token (útil para testing o troubleshooting).
+        El token compartido en Redis expira por sí solo.
+        """
         logger.info("🗑️ Limpiando caché de token de SharePoint")
-        self._token_cache = {
-            "access_token": None,
-            "expires_at": 0,
-        }
+        self._access_token = None
+        self._expires_at = 0.0
+        self.token_version += 1
 
 
 # Instancia global del servicio
@@ -3,15 +3,122 @@ Servicio principal para interactuar con SharePoint Online a través de Microsoft
 Proporciona operaciones CRUD para sitios, listas, documentos y más.
 """
 
+import asyncio
+import functools
 import logging
-import aiohttp
-from typing import Dict, Any, Optional, List
+import random
+import httpx
+import orjson
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from urllib.parse import quote, urlparse
 
-from app.services.sharepoint_auth import sharepoint_auth_service
+from app.core.config import settings
+from app.services.sharepoint_auth import (
+    sharepoint_auth_service,
+    SharePointAPIError,
+    SharePointNotConfiguredError,
+)
 
 logger = logging.getLogger(__name__)
 
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
+
+# Máximo de sub-solicitudes por llamada a /$batch (límite de Microsoft Graph)
+GRAPH_BATCH_MAX_REQUESTS = 20
+
+# Archivos mayores a este tamaño se suben con una sesión de carga por fragmentos
+SIMPLE_UPLOAD_MAX_SIZE = 4 * 1024 * 1024
+# Tamaño de fragmento para sesiones de carga (debe ser múltiplo de 320 KiB)
+UPLOAD_CHUNK_SIZE = 32 * 320 * 1024  # 10 MiB
+# Reintentos ante throttling (429) y errores transitorios de Graph API
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset({429, 503})
+IDEMPOTENT_METHODS = frozenset({"GET", "PUT", "DELETE"})
+
+# Circuit breaker: fallas consecutivas para abrir y segundos que permanece abierto
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+# Caché de metadatos de sitios, listas y drives (cambian en escala de horas)
+METADATA_CACHE_TTL_SECONDS = 300
+METADATA_CACHE_MAX_SIZE = 1024
+
+# Tamaño de lectura por defecto al descargar archivos en streaming
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _read_json(response: httpx.Response) -> Any:
+    """Parsea el cuerpo JSON de una respuesta con orjson (sin decodificar a str)."""
+    return orjson.loads(response.content)
+
+
+@functools.lru_cache(maxsize=256)
+def _site_url(site_id: str) -> str:
+    """Prefijo de URL de un sitio (los IDs de sitio se repiten en casi todas las llamadas)."""
+    return f"{GRAPH_BASE_URL}/sites/{site_id}"
+
+
+@functools.lru_cache(maxsize=256)
+def _drive_url(site_id: str, drive_id: str) -> str:
+    """Prefijo de URL de un drive dentro de un sitio."""
+    return f"{_site_url(site_id)}/drives/{drive_id}"
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter completo."""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Segundos indicados por Graph en el header Retry-After (respuestas 429/503)."""
+    value = response.headers.get("Retry-After")
+    if value and value.isdigit():
+        return min(float(value), RETRY_MAX_DELAY_SECONDS)
+    return None
+
+
+class _CircuitBreaker:
+    """
+    Circuit breaker simple: se abre tras N fallas consecutivas y rechaza llamadas
+    durante reset_seconds; después deja pasar solicitudes de prueba (semiabierto).
+    """
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+    
+    def check(self):
+        """Lanza SharePointAPIError si el circuito está abierto."""
+        if self.failures >= self.failure_threshold and time.monotonic() - self.opened_at < self.reset_seconds:
+            raise SharePointAPIError("Graph API no disponible temporalmente (circuito abierto)")
+    
+    def record_success(self):
+        self.failures = 0
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.failures == self.failure_threshold:
+                logger.error(f"🔌 Circuito de Graph API abierto por {self.reset_seconds}s tras {self.failures} fallas consecutivas")
+            self.opened_at = time.monotonic()
+
+
+def require_configured(fn):
+    """Decorador: rechaza la llamada si el servicio de SharePoint no está configurado."""
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        if not self.is_configured:
+            raise SharePointNotConfiguredError("Servicio de SharePoint no configurado")
+        return await fn(self, *args, **kwargs)
+    return wrapper
+
 
 class SharePointService:
     """
@@ -26,9 +133,7 @@ class SharePointService:
     
     def __init__(self):
         """Inicializa el servicio de SharePoint."""
-        from app.core.config import settings
-        
-        self.graph_base_url = "https://graph.microsoft.com/v1.0"
+        self.graph_base_url = GRAPH_BASE_URL
         self.sharepoint_site_url = getattr(settings, 'sharepoint_site_url', None)
         
         # Extraer site_id si se proporciona URL completa de SharePoint
@@ -39,24 +144,160 @@ class SharePointService:
             parsed = urlparse(self.sharepoint_site_url)
             self.site_hostname = parsed.netloc
             self.site_path = parsed.path.strip('/')
+        
+        # La configuración de autenticación es estática por proceso
+        self.is_configured: bool = sharepoint_auth_service.is_configured
+        
+        # Headers de autenticación cacheados para la versión de token vigente
+        self._headers_version = -1
+        self._cached_headers: Dict[str, str] = {}
+        
+        # Caché LRU de metadatos: url -> (expira en time.monotonic(), etag, cuerpo)
+        self._meta_cache: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        
+        # Cliente HTTP compartido (HTTP/2 multiplexa las solicitudes concurrentes sobre una conexión TLS)
+        # Se crea en el primer uso porque requiere un event loop activo
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        
+        # Corta las llamadas a Graph durante caídas o throttling sostenido
+        self._circuit_breaker = _CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
     
-    @property
-    def is_configured(self) -> bool:
-        """Verifica si el servicio está configurado."""
-        return sharepoint_auth_service.is_configured
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Obtiene el cliente HTTP compartido, creándolo si no existe o fue cerrado."""
+        if self._client is not None and not self._client.is_closed:
+            return self._client
+        
+        async with self._client_lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=75),
+                    timeout=60,
+                    # Las descargas de /content responden con redirección a una URL pre-autenticada
+                    follow_redirects=True
+                )
+            return self._client
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Ejecuta una solicitud a Graph con reintentos (backoff exponencial con jitter) y circuit breaker.
+        
+        Métodos idempotentes se reintentan ante 429/5xx y errores de red; POST/PATCH solo ante
+        429/503 o errores de conexión, donde Graph no llegó a procesar la solicitud.
+        
+        Args:
+            method: Método HTTP
+            url: URL completa
+            **kwargs: Argumentos para httpx (headers, params, content)
+            
+        Returns:
+            httpx.Response: Última respuesta recibida (el llamador valida el status)
+        """
+        self._circuit_breaker.check()
+        client = await self._get_client()
+        
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+        
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == RETRY_ATTEMPTS or not (idempotent or isinstance(e, httpx.ConnectError)):
+                    self._circuit_breaker.record_failure()
+                    raise
+                delay = _backoff_delay(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt == RETRY_ATTEMPTS:
+                    if response.status_code in RETRY_STATUSES:
+                        self._circuit_breaker.record_failure()
+                    else:
+                        self._circuit_breaker.record_success()
+                    return response
+                delay = _retry_after(response) or _backoff_delay(attempt)
+            
+            logger.warning(f"⚠️ Reintentando {method} a Graph API en {delay:.1f}s (intento {attempt}/{RETRY_ATTEMPTS})")
+            await asyncio.sleep(delay)
+    
+    async def close(self):
+        """Cierra el cliente HTTP compartido (llamar al apagar la aplicación)."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
     
     async def _get_headers(self) -> Dict[str, str]:
-        """Obtiene headers HTTP con token de autenticación."""
-        token = await sharepoint_auth_service.get_access_token()
+        """
+        Obtiene headers HTTP con token de autenticación.
+        
+        El dict se reutiliza mientras el token no cambie: no debe modificarse, copiarlo si se necesitan otros headers.
+        """
+        token = sharepoint_auth_service.get_cached_token()
+        if token is None:
+            self._circuit_breaker.check()
+            try:
+                token = await sharepoint_auth_service.get_access_token()
+            except SharePointAPIError:
+                self._circuit_breaker.record_failure()
+                raise
+        
+        version = sharepoint_auth_service.token_version
+        if version != self._headers_version:
+            self._cached_headers = {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+                "Content-Type": "application/json"
+            }
+            self._headers_version = version
         
-        return {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
+        return self._cached_headers
+    
+    async def _get_metadata(self, url: str) -> Dict[str, Any]:
+        """
+        GET de metadatos con caché TTL en memoria y revalidación por ETag.
+        El dict devuelto es compartido por el caché: no debe modificarse.
+        
+        Args:
+            url: URL completa del recurso en Graph API
+            
+        Returns:
+            dict: Cuerpo JSON del recurso
+        """
+        now = time.monotonic()
+        cached = self._meta_cache.get(url)
+        if cached is not None and cached[0] > now:
+            self._meta_cache.move_to_end(url)
+            return cached[2]
+        
+        headers = await self._get_headers()
+        if cached is not None and cached[1]:
+            # Entrada vencida con ETag: Graph responde 304 sin cuerpo si no cambió
+            headers = {**headers, "If-None-Match": cached[1]}
+        
+        response = await self._request("GET", url, headers=headers)
+        
+        if response.status_code == 304 and cached is not None:
+            body = cached[2]
+            etag = cached[1]
+        else:
+            response.raise_for_status()
+            body = _read_json(response)
+            etag = response.headers.get("ETag")
+        
+        self._meta_cache[url] = (time.monotonic() + METADATA_CACHE_TTL_SECONDS, etag, body)
+        self._meta_cache.move_to_end(url)
+        if len(self._meta_cache) > METADATA_CACHE_MAX_SIZE:
+            self._meta_cache.popitem(last=False)
+        
+        return body
+    
+    def clear_metadata_cache(self):
+        """Limpia el caché de metadatos de sitios, listas y drives."""
+        self._meta_cache.clear()
     
     # ==================== SITIOS ====================
     
+    @require_configured
     async def get_root_site(self) -> Dict[str, Any]:
         """
         Obtiene información del sitio raíz de SharePoint.
@@ -64,17 +305,9 @@ class SharePointService:
         Returns:
             dict: Información del sitio raíz
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/root"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(f"{GRAPH_BASE_URL}/sites/root")
     
+    @require_configured
     async def get_site_by_path(self, hostname: str, site_path: str) -> Dict[str, Any]:
         """
         Obtiene información de un sitio específico por su hostname y path.
@@ -86,17 +319,9 @@ class SharePointService:
         Returns:
             dict: Información del sitio
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{hostname}:/{site_path}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(f"{GRAPH_BASE_URL}/sites/{hostname}:/{site_path}")
     
+    @require_configured
     async def get_site_by_id(self, site_id: str) -> Dict[str, Any]:
         """
         Obtiene información de un sitio por su ID.
@@ -107,17 +332,9 @@ class SharePointService:
         Returns:
             dict: Información del sitio
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(_site_url(site_id))
     
+    @require_configured
     async def list_sites(self, search: Optional[str] = None) -> Dict[str, Any]:
         """
         Lista todos los sitios de SharePoint accesibles.
@@ -128,22 +345,19 @@ class SharePointService:
         Returns:
             dict: Lista de sitios
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites"
+        url = f"{GRAPH_BASE_URL}/sites"
         
         if search:
             url += f"?search={quote(search)}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("GET", url, headers=headers)
+        response.raise_for_status()
+        return _read_json(response)
     
     # ==================== LISTAS ====================
     
+    @require_configured
     async def get_lists(self, site_id: str) -> Dict[str, Any]:
         """
         Obtiene todas las listas de un sitio.
@@ -154,17 +368,9 @@ class SharePointService:
         Returns:
             dict: Listas del sitio
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(f"{_site_url(site_id)}/lists")
     
+    @require_configured
     async def get_list_by_id(self, site_id: str, list_id: str) -> Dict[str, Any]:
         """
         Obtiene información de una lista específica.
@@ -176,17 +382,9 @@ class SharePointService:
         Returns:
             dict: Información de la lista
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists/{list_id}"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(f"{_site_url(site_id)}/lists/{list_id}")
     
+    @require_configured
     async def get_list_items(
         self, 
         site_id: str, 
@@ -210,11 +408,8 @@ class SharePointService:
         Returns:
             dict: Elementos de la lista
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists/{list_id}/items"
+        url = f"{_site_url(site_id)}/lists/{list_id}/items"
         
         params = {
             "$top": top,
@@ -228,11 +423,11 @@ class SharePointService:
         if expand:
             params["$expand"] = expand
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("GET", url, headers=headers, params=params)
+        response.raise_for_status()
+        return _read_json(response)
     
+    @require_configured
     async def create_list_item(
         self, 
         site_id: str, 
@@ -250,19 +445,16 @@ class SharePointService:
         Returns:
             dict: Elemento creado
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists/{list_id}/items"
+        url = f"{_site_url(site_id)}/lists/{list_id}/items"
         
         body = {"fields": fields}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=body) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("POST", url, headers=headers, content=orjson.dumps(body))
+        response.raise_for_status()
+        return _read_json(response)
     
+    @require_configured
     async def update_list_item(
         self, 
         site_id: str, 
@@ -282,19 +474,16 @@ class SharePointService:
         Returns:
             dict: Elemento actualizado
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists/{list_id}/items/{item_id}"
+        url = f"{_site_url(site_id)}/lists/{list_id}/items/{item_id}"
         
         body = {"fields": fields}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.patch(url, headers=headers, json=body) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("PATCH", url, headers=headers, content=orjson.dumps(body))
+        response.raise_for_status()
+        return _read_json(response)
     
+    @require_configured
     async def delete_list_item(
         self, 
         site_id: str, 
@@ -312,19 +501,16 @@ class SharePointService:
         Returns:
             bool: True si se eliminó correctamente
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/lists/{list_id}/items/{item_id}"
+        url = f"{_site_url(site_id)}/lists/{list_id}/items/{item_id}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=headers) as response:
-                response.raise_for_status()
-                return True
+        response = await self._request("DELETE", url, headers=headers)
+        response.raise_for_status()
+        return True
     
     # ==================== DRIVES (BIBLIOTECAS DE DOCUMENTOS) ====================
     
+    @require_configured
     async def get_drives(self, site_id: str) -> Dict[str, Any]:
         """
         Obtiene todas las bibliotecas de documentos de un sitio.
@@ -335,17 +521,9 @@ class SharePointService:
         Returns:
             dict: Bibliotecas de documentos
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
-        headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/drives"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await self._get_metadata(f"{_site_url(site_id)}/drives")
     
+    @require_configured
     async def get_drive_items(
         self, 
         site_id: str, 
@@ -363,21 +541,18 @@ class SharePointService:
         Returns:
             dict: Elementos de la carpeta
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
         
         if folder_path == "root":
-            url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/root/children"
+            url = f"{_drive_url(site_id, drive_id)}/root/children"
         else:
-            url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/root:/{folder_path}:/children"
+            url = f"{_drive_url(site_id, drive_id)}/root:/{folder_path}:/children"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("GET", url, headers=headers)
+        response.raise_for_status()
+        return _read_json(response)
     
+    @require_configured
     async def upload_file(
         self, 
         site_id: str, 
@@ -399,23 +574,95 @@ class SharePointService:
         Returns:
             dict: Información del archivo subido
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
+        # Graph no acepta PUT simple para archivos grandes
+        if len(file_content) > SIMPLE_UPLOAD_MAX_SIZE:
+            return await self.upload_large_file(site_id, drive_id, file_name, file_content, folder_path)
+        
+        headers = {**await self._get_headers(), "Content-Type": "application/octet-stream"}
+        url = f"{self._item_path_url(site_id, drive_id, file_name, folder_path)}:/content"
+        
+        response = await self._request("PUT", url, headers=headers, content=file_content)
+        response.raise_for_status()
+        return _read_json(response)
+    
+    @require_configured
+    async def upload_large_file(
+        self, 
+        site_id: str, 
+        drive_id: str,
+        file_name: str,
+        file_content: bytes,
+        folder_path: str = "root",
+        chunk_size: int = UPLOAD_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Sube un archivo grande usando una sesión de carga de Graph (createUploadSession).
+        
+        Args:
+            site_id: ID del sitio
+            drive_id: ID del drive
+            file_name: Nombre del archivo
+            file_content: Contenido del archivo en bytes
+            folder_path: Path de la carpeta destino
+            chunk_size: Tamaño de cada fragmento (múltiplo de 320 KiB)
+            
+        Returns:
+            dict: Información del archivo subido
+        """
+        if chunk_size % (320 * 1024):
+            raise ValueError("El tamaño de fragmento debe ser múltiplo de 320 KiB")
         
         headers = await self._get_headers()
-        headers["Content-Type"] = "application/octet-stream"
+        url = f"{self._item_path_url(site_id, drive_id, file_name, folder_path)}:/createUploadSession"
+        body = {"item": {"@microsoft.graph.conflictBehavior": "replace"}}
         
-        if folder_path == "root":
-            url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/root:/{file_name}:/content"
-        else:
-            url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/root:/{folder_path}/{file_name}:/content"
+        response = await self._request("POST", url, headers=headers, content=orjson.dumps(body))
+        response.raise_for_status()
+        upload_url = (_read_json(response))["uploadUrl"]
         
-        timeout = aiohttp.ClientTimeout(total=60.0)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.put(url, headers=headers, data=file_content) as response:
-                response.raise_for_status()
-                return await response.json()
+        # Graph exige que los fragmentos se envíen en orden; memoryview evita copiar cada porción
+        content = memoryview(file_content)
+        total = len(content)
+        result: Dict[str, Any] = {}
+        
+        try:
+            for start in range(0, total, chunk_size):
+                chunk = content[start:start + chunk_size]
+                result = await self._put_chunk(upload_url, start, chunk, total)
+        except Exception:
+            # Liberar la sesión de carga para no dejar fragmentos huérfanos (sin ocultar el error original)
+            try:
+                await self._request("DELETE", upload_url)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo cancelar la sesión de carga: {str(e)}")
+            raise
+        
+        return result
     
+    async def _put_chunk(
+        self,
+        upload_url: str,
+        start: int,
+        chunk: memoryview,
+        total: int
+    ) -> Dict[str, Any]:
+        """Envía un fragmento a la sesión de carga (la URL ya va pre-autenticada, sin header Authorization)."""
+        end = start + len(chunk) - 1
+        headers = {"Content-Range": f"bytes {start}-{end}/{total}"}
+        
+        # httpx solo acepta bytes como contenido: se copia únicamente el fragmento
+        response = await self._request("PUT", upload_url, headers=headers, content=bytes(chunk))
+        response.raise_for_status()
+        # 202 para fragmentos intermedios, 200/201 con el driveItem al completar
+        return _read_json(response)
+    
+    def _item_path_url(self, site_id: str, drive_id: str, file_name: str, folder_path: str) -> str:
+        """Construye la URL por path de un elemento dentro de un drive."""
+        if folder_path == "root":
+            return f"{_drive_url(site_id, drive_id)}/root:/{file_name}"
+        return f"{_drive_url(site_id, drive_id)}/root:/{folder_path}/{file_name}"
+    
+    @require_configured
     async def download_file(
         self, 
         site_id: str, 
@@ -433,18 +680,56 @@ class SharePointService:
         Returns:
             bytes: Contenido del archivo
         """
+        headers = await self._get_headers()
+        url = f"{_drive_url(site_id, drive_id)}/items/{item_id}/content"
+        
+        # _request aplica reintentos y registra el resultado en el circuit breaker;
+        # httpx arma el contenido (ya descomprimido) con una sola unión de los fragmentos
+        response = await self._request("GET", url, headers=headers)
+        response.raise_for_status()
+        return response.content
+    
+    async def download_file_stream(
+        self, 
+        site_id: str, 
+        drive_id: str,
+        item_id: str,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """
+        Descarga un archivo en fragmentos sin cargarlo completo en memoria.
+        
+        Args:
+            site_id: ID del sitio
+            drive_id: ID del drive
+            item_id: ID del elemento
+            chunk_size: Tamaño máximo de cada fragmento
+            
+        Yields:
+            bytes: Fragmentos del archivo
+        """
         if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
+            raise SharePointNotConfiguredError("Servicio de SharePoint no configurado")
         
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/items/{item_id}/content"
+        url = f"{_drive_url(site_id, drive_id)}/items/{item_id}/content"
         
-        timeout = aiohttp.ClientTimeout(total=60.0)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as response:
+        self._circuit_breaker.check()
+        client = await self._get_client()
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code in RETRY_STATUSES:
+                    self._circuit_breaker.record_failure()
+                else:
+                    self._circuit_breaker.record_success()
                 response.raise_for_status()
-                return await response.read()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+        except httpx.TransportError:
+            self._circuit_breaker.record_failure()
+            raise
     
+    @require_configured
     async def delete_file(
         self, 
         site_id: str, 
@@ -462,19 +747,16 @@ class SharePointService:
         Returns:
             bool: True si se eliminó correctamente
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/sites/{site_id}/drives/{drive_id}/items/{item_id}"
+        url = f"{_drive_url(site_id, drive_id)}/items/{item_id}"
         
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(url, headers=headers) as response:
-                response.raise_for_status()
-                return True
+        response = await self._request("DELETE", url, headers=headers)
+        response.raise_for_status()
+        return True
     
     # ==================== BÚSQUEDA ====================
     
+    @require_configured
     async def search(self, query: str, site_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Busca contenido en SharePoint.
@@ -486,11 +768,8 @@ class SharePointService:
         Returns:
             dict: Resultados de búsqueda
         """
-        if not self.is_configured:
-            raise Exception("Servicio de SharePoint no configurado")
-        
         headers = await self._get_headers()
-        url = f"{self.graph_base_url}/search/query"
+        url = f"{GRAPH_BASE_URL}/search/query"
         
         request_body = {
             "requests": [
@@ -508,10 +787,56 @@ class SharePointService:
                 "siteId": site_id
             }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=request_body) as response:
-                response.raise_for_status()
-                return await response.json()
+        response = await self._request("POST", url, headers=headers, content=orjson.dumps(request_body))
+        response.raise_for_status()
+        return _read_json(response)
+    
+    # ==================== BATCH ====================
+    
+    @require_configured
+    async def batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Ejecuta varias solicitudes a Graph API usando JSON batching (/$batch).
+        
+        Se envían en grupos de hasta 20 sub-solicitudes por llamada.
+        
+        Args:
+            requests: Lista de sub-solicitudes con "method", "url" (relativa a /v1.0,
+                ej: "/sites/{site_id}/lists") y opcionalmente "body" y "headers"
+            
+        Returns:
+            list: Respuestas en el mismo orden que las solicitudes, cada una con "status", "headers" y "body"
+        """
+        headers = await self._get_headers()
+        url = f"{GRAPH_BASE_URL}/$batch"
+        
+        responses: List[Dict[str, Any]] = []
+        for start in range(0, len(requests), GRAPH_BATCH_MAX_REQUESTS):
+            chunk = requests[start:start + GRAPH_BATCH_MAX_REQUESTS]
+            
+            batch_requests = []
+            for index, request in enumerate(chunk):
+                batch_request = {
+                    "id": str(index),
+                    "method": request.get("method", "GET"),
+                    "url": request["url"]
+                }
+                if request.get("body") is not None:
+                    batch_request["body"] = request["body"]
+                    batch_request["headers"] = {"Content-Type": "application/json", **request.get("headers", {})}
+                elif request.get("headers"):
+                    batch_request["headers"] = request["headers"]
+                batch_requests.append(batch_request)
+            
+            response = await self._request("POST", url, headers=headers, content=orjson.dumps({"requests": batch_requests}))
+            response.raise_for_status()
+            result = _read_json(response)
+            
+            # Graph no garantiza el orden de las respuestas: reordenar por id
+            by_id = {item["id"]: item for item in result.get("responses", [])}
+            responses.extend(by_id.get(str(index), {"status": 0}) for index in range(len(chunk)))
+        
+        return responses
     
     # ==================== DIAGNÓSTICO ====================
     
@@ -523,11 +848,12 @@ class SharePointService:
             dict: Estado del servicio
         """
         try:
-            token_info = sharepoint_auth_service.get_token_info()
-            
-            # Intentar obtener el sitio raíz
+            # Intentar obtener el sitio raíz (obtiene o renueva el token si hace falta)
             root_site = await self.get_root_site()
             
+            # get_token_info solo lee el caché en memoria: se consulta después para reflejar el token usado
+            token_info = sharepoint_auth_service.get_token_info()
+            
             return {
                 "status": "healthy",
                 "auth_configured": self.is_configured,
@@ -543,5 +869,81 @@ class SharePointService:
             }
 
 
+class BatchAccumulator:
+    """
+    Acumula lecturas a Graph API y las ejecuta en una sola llamada a /$batch.
+    
+    Ejemplo:
+        batch = BatchAccumulator(sharepoint_service)
+        site = batch.get_site(site_id)
+        lists = batch.get_lists(site_id)
+        await batch.execute()
+        site_info, site_lists = site.result(), lists.result()
+    """
+    
+    def __init__(self, service: SharePointService):
+        self._service = service
+        self._requests: List[Dict[str, Any]] = []
+        self._futures: List[asyncio.Future] = []
+    
+    def add(self, method: str, url: str, body: Optional[Dict[str, Any]] = None) -> asyncio.Future:
+        """
+        Agrega una sub-solicitud pendiente.
+        
+        Args:
+            method: Método HTTP
+            url: URL relativa a /v1.0
+            body: Cuerpo JSON opcional
+            
+        Returns:
+            asyncio.Future: Se resuelve con el body de la respuesta al llamar execute()
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._requests.append({"method": method, "url": url, "body": body})
+        self._futures.append(future)
+        return future
+    
+    def get_site(self, site_id: str) -> asyncio.Future:
+        """Agrega la lectura de un sitio por ID."""
+        return self.add("GET", f"/sites/{site_id}")
+    
+    def get_lists(self, site_id: str) -> asyncio.Future:
+        """Agrega la lectura de las listas de un sitio."""
+        return self.add("GET", f"/sites/{site_id}/lists")
+    
+    def get_list(self, site_id: str, list_id: str) -> asyncio.Future:
+        """Agrega la lectura de una lista específica."""
+        return self.add("GET", f"/sites/{site_id}/lists/{list_id}")
+    
+    def get_drives(self, site_id: str) -> asyncio.Future:
+        """Agrega la lectura de las bibliotecas de documentos de un sitio."""
+        return self.add("GET", f"/sites/{site_id}/drives")
+    
+    async def execute(self) -> None:
+        """Envía las sub-solicitudes pendientes y resuelve cada Future con su respuesta."""
+        requests, futures = self._requests, self._futures
+        self._requests, self._futures = [], []
+        
+        if not requests:
+            return
+        
+        try:
+            responses = await self._service.batch(requests)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            raise
+        
+        for future, response in zip(futures, responses):
+            status = response.get("status", 0)
+            if 200 <= status < 300:
+                future.set_result(response.get("body"))
+            else:
+                error = (response.get("body") or {}).get("error", {})
+                future.set_exception(
+                    SharePointAPIError(f"Error en sub-solicitud de Graph API ({status}): {error.get('message', 'sin detalle')}")
+                )
+
+
 # Instancia global del servicio
 sharepoint_service = SharePointService()
@@ -4,17 +4,22 @@ Proporciona métodos para enviar mensajes de texto, imágenes, videos, documento
 ubicaciones, contactos, mensajes interactivos y autenticación de usuarios.
 """
 
-import aiohttp
+import asyncio
 import json
 import logging
 import secrets
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+import httpx
+import orjson
 from fastapi import HTTPException
 
 from app.core.config import settings
-from app.core.http_request import HTTPClient
+from app.core.httpx_client import get_shared_httpx
 from app.core.redis import redis_client
+from app.services.auth_service import auth_service
 from app.models.whatsapp import (
     WhatsAppMessageSendRequest,
     WhatsAppMessageSendResponse,
@@ -23,6 +28,113 @@ from app.models.whatsapp import (
 
 logger = logging.getLogger(__name__)
 
+# Timeout de las llamadas a la Graph API (envíos, URLs y descargas de media)
+WHATSAPP_TIMEOUT_SECONDS = 30.0
+
+# Control de tasa AIMD: +0.5 de concurrencia por envío exitoso, la mitad al recibir un límite de tasa
+RATE_LIMIT_MAX_CONCURRENCY = 64
+RATE_LIMIT_INCREASE = 0.5
+RATE_LIMIT_DECREASE = 0.5
+# Pausa tras un límite de tasa sin Retry-After, y pausa máxima (evita bloquear las respuestas por minutos)
+THROTTLE_DEFAULT_PAUSE_SECONDS = 1.0
+THROTTLE_MAX_PAUSE_SECONDS = 60.0
+# Estados HTTP y códigos de error de la Graph API que indican límite de tasa o sobrecarga
+_THROTTLE_STATUS_CODES = frozenset({429, 502, 503})
+_THROTTLE_ERROR_CODES = frozenset({4, 80007, 130429, 131048, 131056})
+
+
+def _throttle_pause(response: httpx.Response, error_code: Any) -> Optional[float]:
+    """
+    Segundos de pausa si la respuesta indica límite de tasa, None si no.
+    Usa Retry-After o el tiempo estimado de X-Business-Use-Case-Usage (en minutos).
+    """
+    if response.status_code not in _THROTTLE_STATUS_CODES and error_code not in _THROTTLE_ERROR_CODES:
+        return None
+    
+    pause = THROTTLE_DEFAULT_PAUSE_SECONDS
+    try:
+        retry_after = response.headers.get("Retry-After")
+        usage = response.headers.get("X-Business-Use-Case-Usage")
+        if retry_after:
+            pause = float(retry_after)
+        elif usage:
+            minutes = max(
+                (entry.get("estimated_time_to_regain_access") or 0
+                 for entries in json.loads(usage).values() for entry in entries),
+                default=0
+            )
+            pause = max(minutes * 60, THROTTLE_DEFAULT_PAUSE_SECONDS)
+    except (ValueError, AttributeError, TypeError):
+        pass
+    return min(pause, THROTTLE_MAX_PAUSE_SECONDS)
+
+
+class GraphAPIRateLimiter:
+    """
+    Control de tasa proactivo para los envíos a la Graph API.
+    
+    Combina una ventana deslizante de mensajes por segundo con una concurrencia AIMD:
+    cada envío exitoso la aumenta un poco y cada límite de tasa la reduce a la mitad y
+    pausa los envíos, evitando ráfagas de reintentos contra la API.
+    """
+    
+    def __init__(self, max_per_second: int, max_concurrency: int = RATE_LIMIT_MAX_CONCURRENCY):
+        self.max_per_second = max_per_second
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.throttled_count = 0
+        self._in_flight = 0
+        self._sent: deque = deque()  # time.monotonic() de los envíos del último segundo
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+    
+    async def acquire(self):
+        """Espera un lugar de concurrencia, la pausa por límite de tasa y un hueco en la ventana."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < max(1, int(self.concurrency)))
+            self._in_flight += 1
+        
+        try:
+            while True:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= 1.0:
+                    self._sent.popleft()
+                wait = self._resume_at - now
+                if wait <= 0 and len(self._sent) >= self.max_per_second:
+                    wait = 1.0 - (now - self._sent[0])
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self._sent.append(now)
+        except BaseException:
+            # Cancelado mientras esperaba: libera el lugar sin ajustar la concurrencia
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+            raise
+    
+    async def release(self, throttle_pause: Optional[float] = None):
+        """
+        Libera el lugar de concurrencia y ajusta la concurrencia (AIMD).
+        
+        Args:
+            throttle_pause: Segundos de pausa si la API respondió con límite de tasa (None = sin límite)
+        """
+        async with self._condition:
+            self._in_flight -= 1
+            if throttle_pause is None:
+                self.concurrency = min(self.max_concurrency, self.concurrency + RATE_LIMIT_INCREASE)
+            else:
+                self.throttled_count += 1
+                self.concurrency = max(1.0, self.concurrency * RATE_LIMIT_DECREASE)
+                self._resume_at = max(self._resume_at, time.monotonic() + throttle_pause)
+                logger.warning(
+                    "⚠️ Límite de tasa de WhatsApp API: concurrencia %.1f, pausa de %.1fs",
+                    self.concurrency,
+                    throttle_pause
+                )
+            self._condition.notify_all()
+
 
 class WhatsAppService:
     """
@@ -47,14 +159,19 @@ class WhatsAppService:
         self.api_version = settings.whatsapp_api_version
         self.base_url = f"https://graph.facebook.com/{self.api_version}/{self.phone_number_id}"
         
-        # Cliente HTTP con headers por defecto
-        self.http_client = HTTPClient(
-            base_url=self.base_url,
-            default_headers={
-                "Authorization": f"Bearer {self.access_token}",
-                "Content-Type": "application/json"
-            } if self.access_token else {}
-        )
+        # Las llamadas usan el cliente httpx compartido (HTTP/2): los envíos concurrentes
+        # se multiplexan sobre una sola conexión TLS a graph.facebook.com
+        self._auth_headers = {"Authorization": f"Bearer {self.access_token}"}
+        # El body se serializa con orjson (más rápido que json): el Content-Type se indica aparte
+        self._json_headers = {**self._auth_headers, "Content-Type": "application/json"}
+        # URLs de los endpoints frecuentes (todos los envíos van a "messages")
+        self._urls = {"messages": f"{self.base_url}/messages"}
+        
+        # Control de tasa de los envíos (los límites de la API se respetan antes de recibir un 429)
+        self._rate_limiter = GraphAPIRateLimiter(settings.whatsapp_max_messages_per_second)
+        
+        # Estado del servicio para /status: se arma una sola vez
+        self._status = self._build_status()
         
         if self.access_token and self.phone_number_id:
             pass  # Logger eliminado
@@ -98,41 +215,42 @@ class WhatsAppService:
         """
         self._check_configuration()
         
+        if method not in ("POST", "GET"):
+            raise ValueError(f"Método HTTP no soportado: {method}")
+        
+        await self._rate_limiter.acquire()
+        throttle_pause = None
         try:
-            # Usar los métodos de conveniencia que manejan la sesión correctamente
-            if method == "POST":
-                # Para POST con JSON, necesitamos manejar la sesión directamente
-                full_url = f"{self.base_url}/{endpoint}"
-                headers = {
-                    "Authorization": f"Bearer {self.access_token}",
-                    "Content-Type": "application/json"
-                }
+            full_url = self._urls.get(endpoint) or f"{self.base_url}/{endpoint}"
+            
+            response = await get_shared_httpx().request(
+                method,
+                full_url,
+                content=orjson.dumps(data) if data is not None else None,
+                params=params,
+                headers=self._json_headers if data is not None else self._auth_headers,
+                timeout=WHATSAPP_TIMEOUT_SECONDS
+            )
+            if response.status_code in _THROTTLE_STATUS_CODES:
+                throttle_pause = _throttle_pause(response, None)
+            response_data = orjson.loads(response.content)
+            
+            # Verificar si hay errores
+            if response.status_code >= 400:
+                error_info = response_data.get("error", {})
+                error_message = error_info.get("message", "Error desconocido")
+                error_code = error_info.get("code", "UNKNOWN")
+                throttle_pause = _throttle_pause(response, error_code)
                 
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(full_url, json=data, headers=headers, params=params) as response:
-                        response_data = await response.json()
-                        
-                        # Verificar si hay errores
-                        if response.status >= 400:
-                            error_info = response_data.get("error", {})
-                            error_message = error_info.get("message", "Error desconocido")
-                            error_code = error_info.get("code", "UNKNOWN")
-                            
-                            logger.error(f"❌ Error de WhatsApp API: [{error_code}] {error_message}")
-                            logger.error(f"Response completo: {response_data}")
-                            
-                            raise HTTPException(
-                                status_code=response.status,
-                                detail=f"Error de WhatsApp API: {error_message}"
-                            )
-                        
-                        return response_data
-                        
-            elif method == "GET":
-                response_data = await self.http_client.get_json(f"{endpoint}", params=params)
-                return response_data
-            else:
-                raise ValueError(f"Método HTTP no soportado: {method}")
+                logger.error(f"❌ Error de WhatsApp API: [{error_code}] {error_message}")
+                logger.error(f"Response completo: {response_data}")
+                
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"Error de WhatsApp API: {error_message}"
+                )
+            
+            return response_data
                         
         except HTTPException:
             raise
@@ -142,6 +260,8 @@ class WhatsAppService:
                 status_code=503,
                 detail=f"Error de conexión con WhatsApp API: {str(e)}"
             )
+        finally:
+            await self._rate_limiter.release(throttle_pause)
     
     async def send_message(self, message_request: WhatsAppMessageSendRequest) -> WhatsAppMessageSendResponse:
         """
@@ -165,6 +285,59 @@ class WhatsAppService:
         
         return WhatsAppMessageSendResponse(**response)
     
+    async def _send_raw(self, to: str, message_type: str, content: Dict[str, Any]) -> WhatsAppMessageSendResponse:
+        """
+        Envía un mensaje armando el payload directamente, sin pasar por WhatsAppMessageSendRequest.
+        Los métodos send_* ya tienen el contenido en el formato de la API: validarlo con Pydantic
+        y volver a convertirlo a dict solo duplicaría el trabajo.
+        
+        Args:
+            to: Número de teléfono del destinatario
+            message_type: Tipo de mensaje (text, image, video, ...)
+            content: Contenido del mensaje según el tipo
+            
+        Returns:
+            WhatsAppMessageSendResponse con la información del mensaje enviado
+        """
+        response = await self._make_request("POST", "messages", data={
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": to,
+            "type": message_type,
+            message_type: content
+        })
+        return WhatsAppMessageSendResponse(**response)
+    
+    async def send_bulk(
+        self,
+        messages: List[WhatsAppMessageSendRequest],
+        concurrency: Optional[int] = None
+    ) -> List[Union[WhatsAppMessageSendResponse, Exception]]:
+        """
+        Envía varios mensajes en paralelo, con un máximo de envíos simultáneos.
+        
+        Args:
+            messages: Mensajes a enviar
+            concurrency: Máximo de envíos simultáneos (default: settings.whatsapp_bulk_concurrency)
+            
+        Returns:
+            Una respuesta por mensaje, en el mismo orden; los envíos fallidos devuelven la excepción
+            en lugar de interrumpir el resto
+            
+        Example:
+            results = await whatsapp_service.send_bulk([
+                WhatsAppMessageSendRequest(to=to, type="text", text={"body": "Hola"})
+                for to in recipients
+            ])
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.whatsapp_bulk_concurrency)
+        
+        async def send_one(message_request: WhatsAppMessageSendRequest) -> WhatsAppMessageSendResponse:
+            async with semaphore:
+                return await self.send_message(message_request)
+        
+        return await asyncio.gather(*(send_one(m) for m in messages), return_exceptions=True)
+    
     async def send_text_message(self, to: str, body: str, preview_url: bool = False) -> WhatsAppMessageSendResponse:
         """
         Envía un mensaje de texto simple.
@@ -183,16 +356,10 @@ class WhatsAppService:
                 body="Hola, ¿cómo estás?"
             )
         """
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="text",
-            text={
-                "body": body,
-                "preview_url": preview_url
-            }
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "text", {
+            "body": body,
+            "preview_url": preview_url
+        })
     
     async def send_image(
         self, 
@@ -230,13 +397,7 @@ class WhatsAppService:
         if caption:
             image_data["caption"] = caption
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="image",
-            image=image_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "image", image_data)
     
     async def send_video(
         self,
@@ -271,13 +432,7 @@ class WhatsAppService:
         if caption:
             video_data["caption"] = caption
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="video",
-            video=video_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "video", video_data)
     
     async def send_document(
         self,
@@ -316,13 +471,7 @@ class WhatsAppService:
         if caption:
             document_data["caption"] = caption
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="document",
-            document=document_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "document", document_data)
     
     async def send_audio(
         self,
@@ -353,13 +502,7 @@ class WhatsAppService:
         if audio_id:
             audio_data["id"] = audio_id
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="audio",
-            audio=audio_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "audio", audio_data)
     
     async def send_location(
         self,
@@ -391,13 +534,7 @@ class WhatsAppService:
         if address:
             location_data["address"] = address
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="location",
-            location=location_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "location", location_data)
     
     async def send_template(
         self,
@@ -432,13 +569,7 @@ class WhatsAppService:
         if components:
             template_data["components"] = components
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="template",
-            template=template_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "template", template_data)
     
     async def send_interactive_buttons(
         self,
@@ -497,13 +628,7 @@ class WhatsAppService:
         if footer_text:
             interactive_data["footer"] = {"text": footer_text}
         
-        message_request = WhatsAppMessageSendRequest(
-            to=to,
-            type="interactive",
-            interactive=interactive_data
-        )
-        
-        return await self.send_message(message_request)
+        return await self._send_raw(to, "interactive", interactive_data)
     
     async def get_media_url(self, media_id: str) -> str:
         """
@@ -523,15 +648,9 @@ class WhatsAppService:
         url = f"https://graph.facebook.com/{self.api_version}/{media_id}"
         
         try:
-            # Usar HTTPClient con headers de autorización
-            http_client = HTTPClient(
-                default_headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                }
-            )
-            
-            # Usar get_json para obtener la respuesta parseada directamente
-            data = await http_client.get_json(url)
+            response = await get_shared_httpx().get(url, headers=self._auth_headers, timeout=WHATSAPP_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
             
             media_url = data.get("url")
             
@@ -568,17 +687,10 @@ class WhatsAppService:
         self._check_configuration()
         
         try:
-            # Usar HTTPClient con headers de autorización
-            http_client = HTTPClient(
-                default_headers={
-                    "Authorization": f"Bearer {self.access_token}"
-                }
-            )
-            
-            # Usar get_bytes para obtener el contenido directamente
-            content = await http_client.get_bytes(media_url)
-            
-            return content
+            # El CDN de media de WhatsApp también requiere el token
+            response = await get_shared_httpx().get(media_url, headers=self._auth_headers, timeout=WHATSAPP_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            return response.content
                     
         except HTTPException:
             raise
@@ -647,13 +759,48 @@ class WhatsAppService:
             logger.error(f"❌ Error marcando mensaje como leído: {str(e)}")
             return False
     
+    async def send_typing_indicator(self, message_id: str) -> bool:
+        """
+        Muestra el indicador "escribiendo..." al usuario mientras se prepara la respuesta.
+        También marca el mensaje como leído; el indicador desaparece al responder o tras 25 segundos.
+        
+        Args:
+            message_id: ID del mensaje recibido al que se va a responder
+            
+        Returns:
+            bool: True si se envió exitosamente, False en caso contrario
+        """
+        try:
+            message_data = {
+                "messaging_product": "whatsapp",
+                "status": "read",
+                "message_id": message_id,
+                "typing_indicator": {"type": "text"}
+            }
+            
+            response = await self._make_request("POST", "messages", data=message_data)
+            
+            if response.get("success"):
+                return True
+            else:
+                logger.warning(f"⚠️ No se pudo enviar indicador de escritura: {response}")
+                return False
+                
+        except Exception as e:
+            logger.error(f"❌ Error enviando indicador de escritura: {str(e)}")
+            return False
+    
     async def get_service_status(self) -> Dict[str, Any]:
         """
         Obtiene el estado del servicio de WhatsApp.
         
         Returns:
-            Dict con el estado y configuración del servicio
+            Dict con el estado y configuración del servicio (no modificar: es compartido)
         """
+        return self._status
+    
+    def _build_status(self) -> Dict[str, Any]:
+        """Construye el estado del servicio (la configuración no cambia tras __init__)."""
         return {
             "service": "WhatsApp Business API",
             "configured": self.is_configured,
@@ -730,7 +877,7 @@ class WhatsAppService:
         
         phone_number = data.get("phone_number")
         bot_phone_number = data.get("bot_phone_number")
-        logger.info(f"✅ Token válido para {phone_number}")
+        logger.info("✅ Token válido para %s", phone_number)
         return (phone_number, bot_phone_number)
     
     async def delete_auth_token(self, token: str) -> bool:
@@ -772,8 +919,6 @@ class WhatsAppService:
         Returns:
             True si se guardó exitosamente
         """
-        from app.services.auth_service import auth_service
-        
         return await auth_service.save_session(
             user_id=phone_number,
             user_data=user_data,
@@ -791,8 +936,6 @@ class WhatsAppService:
         Returns:
             Datos del usuario si está autenticado, None si no está autenticado o expiró
         """
-        from app.services.auth_service import auth_service
-        
         return await auth_service.get_session(
             user_id=phone_number,
             session_type="whatsapp"
@@ -808,8 +951,6 @@ class WhatsAppService:
         Returns:
             True si está autenticado, False si no
         """
-        from app.services.auth_service import auth_service
-        
         return await auth_service.is_authenticated(
             user_id=phone_number,
             session_type="whatsapp"
@@ -825,8 +966,6 @@ class WhatsAppService:
         Returns:
             True si se eliminó, False si no existía
         """
-        from app.services.auth_service import auth_service
-        
         return await auth_service.delete_session(
             user_id=phone_number,
             session_type="whatsapp"
@@ -847,8 +986,6 @@ class WhatsAppService:
         Returns:
             True si se extendió exitosamente, False si no estaba autenticado
         """
-        from app.services.auth_service import auth_service
-        
         return await auth_service.extend_session(
             user_id=phone_number,
             session_type="whatsapp",
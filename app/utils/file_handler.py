@@ -4,18 +4,28 @@ Funciones para procesar, guardar y eliminar archivos físicos.
 """
 
 import os
+import asyncio
+import shutil
 import logging
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional, Tuple
 from fastapi import UploadFile
 from app.core.config import settings
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Tamaño máximo en memoria antes de volcar el archivo subido a disco
+UPLOAD_SPOOL_MAX_SIZE = 10 * 1024 * 1024
+# Tamaño de bloque para leer el archivo subido
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
+
+@lru_cache(maxsize=1)
 def get_media_base_dir() -> Path:
-    """Obtiene el directorio base para archivos multimedia desde settings."""
+    """Obtiene el directorio base para archivos multimedia desde settings (resuelto una sola vez)."""
     # Si es ruta absoluta, usarla directamente
     media_dir = Path(settings.media_file_base_dir)
     if media_dir.is_absolute():
@@ -77,12 +87,48 @@ def get_file_info(file: UploadFile) -> dict:
     }
 
 
-async def save_media_file(file: UploadFile, filename_from_db: str) -> str:
+async def read_upload_file(file: UploadFile) -> Tuple[SpooledTemporaryFile, int, dict]:
     """
-    Guarda el archivo físicamente en el directorio de medios.
+    Lee el archivo subido una sola vez, obteniendo contenido, tamaño e información.
     
     Args:
         file: Archivo subido por el usuario
+        
+    Returns:
+        Tupla (spool con el contenido posicionado al inicio, tamaño en bytes, información del archivo)
+    """
+    spool = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+    try:
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            # Al superar el máximo el spool se vuelca a disco: esas escrituras van fuera del event loop
+            if size > UPLOAD_SPOOL_MAX_SIZE:
+                await asyncio.to_thread(spool.write, chunk)
+            else:
+                spool.write(chunk)
+        spool.seek(0)
+        
+        return spool, size, get_file_info(file)
+    except Exception as e:
+        spool.close()
+        logger.error(f"Error al leer archivo subido {file.filename}: {str(e)}")
+        raise
+
+
+def _write_file(file: BinaryIO, file_path: Path) -> None:
+    """Copia el contenido de un objeto tipo archivo a disco (operación bloqueante)."""
+    file.seek(0)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file, buffer, UPLOAD_CHUNK_SIZE)
+
+
+async def save_media_file(file: BinaryIO, filename_from_db: str) -> str:
+    """
+    Guarda el archivo físicamente en el directorio de medios.
+    
+    Args:
+        file: Contenido del archivo (objeto tipo archivo, ver read_upload_file)
         filename_from_db: Nombre del archivo retornado por la base de datos
         
     Returns:
@@ -99,10 +145,8 @@ async def save_media_file(file: UploadFile, filename_from_db: str) -> str:
         media_dir = get_media_base_dir()
         file_path = media_dir / filename_from_db
         
-        # Guardar el archivo
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Guardar el archivo en un hilo para no bloquear el event loop
+        await asyncio.to_thread(_write_file, file, file_path)
         
         logger.info(f"Archivo guardado: {file_path}")
         return str(file_path)
@@ -144,27 +188,3 @@ def delete_media_file(filename: str) -> bool:
     except Exception as e:
         logger.error(f"Error al eliminar archivo {filename}: {str(e)}")
         raise
-
-
-async def get_file_size(file: UploadFile) -> int:
-    """
-    Obtiene el tamaño del archivo en bytes.
-    
-    Args:
-        file: Archivo subido por el usuario
-        
-    Returns:
-        Tamaño del archivo en bytes
-    """
-    try:
-        # Leer el contenido para obtener el tamaño
-        content = await file.read()
-        size = len(content)
-        
-        # Resetear el puntero del archivo para poder leerlo nuevamente
-        await file.seek(0)
-        
-        return size
-    except Exception as e:
-        logger.error(f"Error al obtener tamaño del archivo: {str(e)}")
-        raise
@@ -11,6 +11,8 @@ BEGIN
   DECLARE @page INT;
   DECLARE @itemPerPage INT;
   DECLARE @mediaType NVARCHAR(20);
+  DECLARE @includeTotal BIT;
+  DECLARE @total INT;
   
   -- Inicializar con valores por defecto
   SET @search = '%';
@@ -18,6 +20,7 @@ BEGIN
   SET @page = 1;
   SET @itemPerPage = 10;
   SET @mediaType = NULL;
+  SET @includeTotal = 1;
   
   -- Sobrescribir con valores del JSON si existen
   IF @json != '{}' AND @json IS NOT NULL AND LEN(@json) > 2
@@ -28,14 +31,16 @@ BEGIN
       @sort = ISNULL(sort, @sort),
       @page = ISNULL(page, @page),
       @itemPerPage = ISNULL(itemPerPage, @itemPerPage),
-      @mediaType = mediaType
+      @mediaType = mediaType,
+      @includeTotal = ISNULL(includeTotal, @includeTotal)
     FROM OPENJSON(@json) WITH (
       idCompany INT,
       search NVARCHAR(50),
       sort NVARCHAR(50),
       page INT,
       itemPerPage INT,
-      mediaType NVARCHAR(20)
+      mediaType NVARCHAR(20),
+      includeTotal BIT
     );
   END
 
@@ -47,6 +52,8 @@ BEGIN
   END
 
   -- Query principal con CTE para paginación
+  -- El total se calcula con COUNT(*) OVER () en la misma pasada que la página,
+  -- evitando un segundo recorrido con COUNT(*) sobre el CTE
   ; WITH MediaFileQuery AS (
     SELECT 
       ROW_NUMBER() OVER (
@@ -59,6 +66,7 @@ BEGIN
           IIF(@sort = 'createAt_desc', MF.createAt, NULL) DESC,
           MF.createAt DESC
       ) RowNum,
+      IIF(@includeTotal = 1, COUNT(*) OVER (), NULL) total,
       MF.idMediaFile,
       MF.nameMediaFile,
       MF.pathMediaFile,
@@ -72,25 +80,49 @@ BEGIN
       AND (MF.nameMediaFile LIKE @search OR MF.mimetype LIKE @search)
       AND (@mediaType IS NULL OR MF.mediaType = @mediaType)
   )
+  SELECT *
+  INTO #MediaFilePage
+  FROM MediaFileQuery
+  WHERE RowNum BETWEEN (@page - 1) * @itemPerPage + 1 AND @page * @itemPerPage;
+
+  IF @includeTotal = 1
+  BEGIN
+    SELECT @total = MAX(total) FROM #MediaFilePage;
+
+    -- Página fuera de rango: no hay filas de donde tomar el total
+    IF @total IS NULL
+    BEGIN
+      SELECT @total = COUNT(*)
+      FROM tbMediaFile MF
+      INNER JOIN tbCompanyMediaFile CMF ON MF.idMediaFile = CMF.idMediaFile
+      WHERE CMF.idCompany = @idCompany
+        AND (MF.nameMediaFile LIKE @search OR MF.mimetype LIKE @search)
+        AND (@mediaType IS NULL OR MF.mediaType = @mediaType);
+    END
+  END
+
+  -- Si includeTotal = 0 se omite "total" (el llamador ya lo conoce)
   SELECT @json = JSON_QUERY((
     SELECT 
-      (SELECT COUNT(*) FROM MediaFileQuery) total,
+      @total total,
       JSON_QUERY(ISNULL((
         SELECT 
-          MFQ.idMediaFile,
-          MFQ.nameMediaFile,
-          MFQ.pathMediaFile,
-          MFQ.sizeMediaFile,
-          MFQ.mimetype,
-          MFQ.mediaType,
-          MFQ.createAt
-        FROM MediaFileQuery MFQ
-        WHERE MFQ.RowNum BETWEEN (@page - 1) * @itemPerPage + 1 AND @page * @itemPerPage
+          MFP.idMediaFile,
+          MFP.nameMediaFile,
+          MFP.pathMediaFile,
+          MFP.sizeMediaFile,
+          MFP.mimetype,
+          MFP.mediaType,
+          MFP.createAt
+        FROM #MediaFilePage MFP
+        ORDER BY MFP.RowNum
         FOR JSON PATH
       ), '[]')) data
     FOR JSON PATH, WITHOUT_ARRAY_WRAPPER
   ));
   
+  DROP TABLE #MediaFilePage;
+  
   -- Retornar resultado
   SELECT JSON_QUERY(@json) json;
 END
@@ -119,6 +151,14 @@ EXEC spMediaFileGet @json = N'{
   "itemPerPage": 20
 }';
 
+-- Obtener una página sin recalcular el total (ya conocido por el llamador)
+EXEC spMediaFileGet @json = N'{
+  "idCompany": 1,
+  "page": 3,
+  "itemPerPage": 10,
+  "includeTotal": false
+}';
+
 -- Obtener todos con paginación específica
 EXEC spMediaFileGet @json = N'{
   "idCompany": 1,
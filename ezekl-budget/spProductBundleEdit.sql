@@ -0,0 +1,101 @@
+CREATE OR ALTER PROCEDURE spProductBundleEdit
+  @json NVARCHAR(MAX)
+AS
+BEGIN
+  SET NOCOUNT ON;
+  DECLARE @idProduct INT = JSON_VALUE(@json, '$.idProduct');
+  DECLARE @idCompany INT = JSON_VALUE(@json, '$.idCompany');
+  DECLARE @configuration NVARCHAR(MAX) = JSON_QUERY(@json, '$.configuration');
+  -- Descarta el JSON que retorna cada SP interno
+  DECLARE @result TABLE (json NVARCHAR(MAX));
+
+  -- Validar que el producto existe y pertenece a la compañía
+  IF NOT EXISTS (
+    SELECT 1
+    FROM tbCompanyProduct
+    WHERE idProduct = @idProduct
+    AND idCompany = @idCompany
+  )
+  BEGIN
+    RAISERROR(N'Error: El producto no existe.', 16, 1);
+    RETURN;
+  END
+
+  BEGIN TRY
+    BEGIN TRAN;
+
+    -- Cuentas contables (lee $.idCompany, $.idProduct y $.accountingAccount)
+    IF JSON_QUERY(@json, '$.accountingAccount') IS NOT NULL
+      INSERT INTO @result
+      EXEC spProductAccountingAccountEdit @json;
+
+    -- Tipos de entrega (lee $.idCompany, $.idProduct y $.deliveryType)
+    IF JSON_QUERY(@json, '$.deliveryType') IS NOT NULL
+      INSERT INTO @result
+      EXEC spProductDeliveryTypeEdit @json;
+
+    -- Configuración (espera los campos en la raíz del JSON)
+    IF @configuration IS NOT NULL
+    BEGIN
+      SET @configuration = JSON_MODIFY(@configuration, '$.idCompany', @idCompany);
+      SET @configuration = JSON_MODIFY(@configuration, '$.idProduct', @idProduct);
+
+      INSERT INTO @result
+      EXEC spProductConfigurationEdit @configuration;
+    END
+
+    COMMIT TRAN;
+  END TRY
+  BEGIN CATCH
+    IF @@TRANCOUNT > 0
+      ROLLBACK TRAN;
+    THROW;
+  END CATCH
+
+  -- Preparar query
+  SET @json = JSON_QUERY((
+    SELECT @idProduct idProduct
+    FOR JSON PATH, WITHOUT_ARRAY_WRAPPER
+  ));
+
+  SELECT JSON_QUERY(@json) json;
+END
+GO
+BEGIN TRAN
+-- Probar el procedimiento
+EXEC spProductBundleEdit @json = N'{
+  "idCompany": 1
+  , "idProduct": 34
+  , "accountingAccount": [
+    {
+      "idAccountingAccount": 5
+      , "effect": 1
+      , "percent": 100
+      , "idProductAccountingAccount": 67
+    },
+    {
+      "idAccountingAccount": 6
+      , "effect": -1
+      , "percent": 100
+      , "idProductAccountingAccount": 68
+    }
+  ]
+  , "deliveryType": [
+    {
+      "idDeliveryType": 1
+      , "active": true
+      , "price": 13.1313
+      , "idProductDeliveryType": 67
+    }
+  ]
+  , "configuration": {
+    "isMainCategory": false
+    , "isCategory": false
+    , "isProduct": true
+    , "isIngredient": false
+    , "isAdditional": false
+    , "isCombo": false
+    , "isUniqueSelection": false
+  }
+}';
+ROLLBACK TRAN
@@ -5,11 +5,25 @@ BEGIN
   SET NOCOUNT ON;
   DECLARE @idCompany INT = JSON_VALUE(@json, '$.idCompany');
   DECLARE @idProduct INT = JSON_VALUE(@json, '$.idProduct');
-  DECLARE @idMediaFile INT;
-  DECLARE @idProductMediaFile INT;
-  DECLARE @mediaFileJson NVARCHAR(MAX);
-  DECLARE @resultJson NVARCHAR(MAX);
+  DECLARE @timestamp NVARCHAR(20) = FORMAT(GETDATE(), 'yyyyMMddHHmmSS');
+  DECLARE @pathMediaFile NVARCHAR(500) = 'uploads/';
   DECLARE @currentPriority INT;
+  DECLARE @mediaFiles TABLE (
+    ordinal INT
+    , sizeMediaFile BIGINT
+    , mimetype VARCHAR(100)
+    , mediaType VARCHAR(50)
+    , extension NVARCHAR(20)
+  );
+  DECLARE @inserted TABLE (
+    ordinal INT
+    , idMediaFile INT
+  );
+  DECLARE @results TABLE (
+    orderIndex INT
+    , idProductMediaFile INT
+    , idMediaFile INT
+  );
 
   -- Validar que el producto existe y pertenece a la compañía
   IF NOT EXISTS (
@@ -28,84 +42,79 @@ BEGIN
   FROM tbProductMediaFile
   WHERE idProduct = @idProduct;
 
-  -- Tabla temporal para almacenar resultados
-  CREATE TABLE #Results (
-    orderIndex INT,
-    idProductMediaFile INT,
-    idMediaFile INT,
-    nameMediaFile NVARCHAR(200),
-    pathMediaFile NVARCHAR(500),
-    urlMediaFile NVARCHAR(600)
-  );
-
-  -- Iterar sobre cada mediaFile en el array
-  DECLARE mediaCursor CURSOR FOR
-  SELECT value
-  FROM OPENJSON(@json, '$.mediaFiles');
-
-  OPEN mediaCursor;
-  FETCH NEXT FROM mediaCursor INTO @mediaFileJson;
-
-  WHILE @@FETCH_STATUS = 0
-  BEGIN
-    -- Agregar idCompany al JSON del mediaFile
-    SET @mediaFileJson = JSON_MODIFY(@mediaFileJson, '$.idCompany', @idCompany);
-
-    -- Llamar a spMediaFileAdd para crear el archivo
-    DECLARE @mediaResult TABLE (json NVARCHAR(MAX));
-    INSERT INTO @mediaResult
-    EXEC spMediaFileAdd @json = @mediaFileJson;
-
-    -- Extraer el idMediaFile del resultado
-    SELECT @resultJson = json FROM @mediaResult;
-    SET @idMediaFile = JSON_VALUE(@resultJson, '$.idMediaFile');
-
-    -- Incrementar prioridad para este registro
-    SET @currentPriority = @currentPriority + 1;
-
-    -- Crear relación ProductMediaFile con prioridad
+  -- Cargar archivos recibidos (ordinal conserva el orden del array para el llamador)
+  INSERT INTO @mediaFiles (ordinal, sizeMediaFile, mimetype, mediaType, extension)
+  SELECT ISNULL(MF.ordinal, CAST(J.[key] AS INT))
+  , MF.sizeMediaFile, MF.mimetype, MF.mediaType, MF.extension
+  FROM OPENJSON(@json, '$.mediaFiles') J
+  CROSS APPLY OPENJSON(J.value) WITH (
+    ordinal INT
+    , sizeMediaFile BIGINT
+    , mimetype VARCHAR(100)
+    , mediaType VARCHAR(50)
+    , extension NVARCHAR(20)
+  ) MF;
+
+  BEGIN TRY
+    BEGIN TRAN;
+
+    -- Crear todos los archivos en una sola sentencia
+    -- (MERGE permite capturar el ordinal de origen junto al id generado)
+    MERGE tbMediaFile AS T
+    USING @mediaFiles AS S
+    ON 1 = 0
+    WHEN NOT MATCHED THEN
+      INSERT (nameMediaFile, pathMediaFile, sizeMediaFile, mimetype, mediaType)
+      VALUES (@timestamp + '.' + S.extension, @pathMediaFile, S.sizeMediaFile, S.mimetype, S.mediaType)
+    OUTPUT S.ordinal, inserted.idMediaFile INTO @inserted (ordinal, idMediaFile);
+
+    -- Actualizar nombre y path con el id generado (mismo formato que spMediaFileAdd)
+    UPDATE MF
+    SET MF.nameMediaFile = CAST(MF.idMediaFile AS VARCHAR) + '_' + MF.nameMediaFile
+    , MF.pathMediaFile = @pathMediaFile + CAST(MF.idMediaFile AS VARCHAR) + '_' + MF.nameMediaFile
+    FROM tbMediaFile MF
+    INNER JOIN @inserted I
+    ON I.idMediaFile = MF.idMediaFile;
+
+    -- Crear company
+    INSERT INTO tbCompanyMediaFile (idCompany, idMediaFile)
+    SELECT @idCompany, idMediaFile
+    FROM @inserted;
+
+    -- Crear relaciones ProductMediaFile con prioridad consecutiva según el orden recibido
     INSERT INTO tbProductMediaFile (idProduct, idMediaFile, priority)
-    VALUES (@idProduct, @idMediaFile, @currentPriority);
-
-    SET @idProductMediaFile = SCOPE_IDENTITY();
-
-    -- Guardar resultado con orden
-    INSERT INTO #Results (orderIndex, idProductMediaFile, idMediaFile, nameMediaFile, pathMediaFile, urlMediaFile)
-    SELECT 
-      @currentPriority,
-      @idProductMediaFile,
-      JSON_VALUE(@resultJson, '$.idMediaFile'),
-      JSON_VALUE(@resultJson, '$.nameMediaFile'),
-      JSON_VALUE(@resultJson, '$.pathMediaFile'),
-      JSON_VALUE(@resultJson, '$.urlMediaFile');
-
-    -- Limpiar tabla temporal para siguiente iteración
-    DELETE FROM @mediaResult;
-
-    FETCH NEXT FROM mediaCursor INTO @mediaFileJson;
-  END;
-
-  CLOSE mediaCursor;
-  DEALLOCATE mediaCursor;
-
-  -- Preparar respuesta JSON con todos los mediaFiles creados
+    OUTPUT inserted.priority, inserted.idProductMediaFile, inserted.idMediaFile
+    INTO @results (orderIndex, idProductMediaFile, idMediaFile)
+    SELECT @idProduct, idMediaFile
+    , @currentPriority + ROW_NUMBER() OVER (ORDER BY ordinal)
+    FROM @inserted;
+
+    COMMIT TRAN;
+  END TRY
+  BEGIN CATCH
+    IF @@TRANCOUNT > 0
+      ROLLBACK TRAN;
+    THROW;
+  END CATCH
+
+  -- Preparar respuesta JSON con todos los mediaFiles creados (en el orden recibido)
   SET @json = JSON_QUERY((
-    SELECT @idProductMediaFile idProductMediaFile
+    SELECT (SELECT TOP 1 idProductMediaFile FROM @results ORDER BY orderIndex DESC) idProductMediaFile
     , (
       SELECT 
-        idProductMediaFile,
-        idMediaFile,
-        nameMediaFile,
-        pathMediaFile,
-        urlMediaFile
-      FROM #Results
-      ORDER BY orderIndex
+        R.idProductMediaFile,
+        R.idMediaFile,
+        MF.nameMediaFile,
+        MF.pathMediaFile,
+        'https://img.ezekl.com/' + MF.nameMediaFile urlMediaFile
+      FROM @results R
+      INNER JOIN tbMediaFile MF
+      ON MF.idMediaFile = R.idMediaFile
+      ORDER BY R.orderIndex
       FOR JSON PATH
     ) AS mediaFiles
     FOR JSON PATH, WITHOUT_ARRAY_WRAPPER
   ));
-
-  DROP TABLE #Results;
   
   SELECT JSON_QUERY(@json) json;
 END
@@ -115,13 +124,15 @@ EXEC spProductMediaFileAdd @json = N'{
   , "idProduct": 1
   , "mediaFiles": [
     {
-      "sizeMediaFile": "2048576"
+      "ordinal": 0
+      , "sizeMediaFile": "2048576"
       , "mimetype": "image/jpeg"
       , "mediaType": "image"
       , "extension": "jpg"
     },
     {
-      "sizeMediaFile": "2048576"
+      "ordinal": 1
+      , "sizeMediaFile": "2048576"
       , "mimetype": "image/jpeg"
       , "mediaType": "image"
       , "extension": "jpg"
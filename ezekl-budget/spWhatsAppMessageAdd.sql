@@ -0,0 +1,63 @@
+-- Tabla del historial de conversaciones de WhatsApp con la IA (solo inserciones)
+IF OBJECT_ID('tbWhatsAppMessage', 'U') IS NULL
+BEGIN
+  CREATE TABLE tbWhatsAppMessage (
+    idWhatsAppMessage BIGINT IDENTITY(1,1) PRIMARY KEY
+    , idCompany INT NOT NULL
+    , phoneNumber NVARCHAR(255) NOT NULL  -- teléfono o identificador del usuario (email, ID, etc.)
+    , role VARCHAR(20) NOT NULL
+    , content NVARCHAR(MAX) NOT NULL
+    , createdAt DATETIME2 NOT NULL
+  );
+  CREATE INDEX IX_tbWhatsAppMessage_phoneNumber
+  ON tbWhatsAppMessage (idCompany, phoneNumber, createdAt);
+END
+GO
+
+-- Ampliar phoneNumber en tablas creadas con VARCHAR(20): la IA también recibe emails e IDs como usuario
+IF COL_LENGTH('tbWhatsAppMessage', 'phoneNumber') < 510
+BEGIN
+  DROP INDEX IX_tbWhatsAppMessage_phoneNumber ON tbWhatsAppMessage;
+  ALTER TABLE tbWhatsAppMessage ALTER COLUMN phoneNumber NVARCHAR(255) NOT NULL;
+  CREATE INDEX IX_tbWhatsAppMessage_phoneNumber
+  ON tbWhatsAppMessage (idCompany, phoneNumber, createdAt);
+END
+GO
+
+CREATE OR ALTER PROCEDURE spWhatsAppMessageAdd
+  @json NVARCHAR(MAX)
+AS
+BEGIN
+  SET NOCOUNT ON;
+  DECLARE @idCompany INT = JSON_VALUE(@json, '$.idCompany');
+  DECLARE @inserted INT;
+
+  -- Insertar el lote de mensajes recibido
+  INSERT INTO tbWhatsAppMessage (idCompany, phoneNumber, role, content, createdAt)
+  SELECT @idCompany, phoneNumber, role, content, createdAt
+  FROM OPENJSON(@json, '$.messages') WITH (
+    phoneNumber NVARCHAR(255)
+    , role VARCHAR(20)
+    , content NVARCHAR(MAX)
+    , createdAt DATETIME2
+  );
+  SET @inserted = @@ROWCOUNT;
+
+  -- Preparar respuesta JSON
+  SET @json = JSON_QUERY((
+    SELECT @inserted inserted
+    FOR JSON PATH, WITHOUT_ARRAY_WRAPPER
+  ));
+
+  SELECT JSON_QUERY(@json) json;
+END
+GO
+
+-- Probar el procedimiento
+EXEC spWhatsAppMessageAdd @json = N'{
+  "idCompany": 1,
+  "messages": [
+    {"phoneNumber": "50688888888", "role": "user", "content": "Hola", "createdAt": "2025-01-01T10:00:00"},
+    {"phoneNumber": "50688888888", "role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarte?", "createdAt": "2025-01-01T10:00:02"}
+  ]
+}';